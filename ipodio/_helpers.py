@@ -1,5 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import re
+import unicodedata
+
+
+ARTICLES = re.compile(r'^(the|a|an)\s+', re.UNICODE)
+
+
+def fold(text, articles=False):
+    """Text without case, accents or repeated spaces, and without a leading
+    article when `articles` is set, so it compares as people read it"""
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    text = unicodedata.normalize('NFKD', text).lower()
+    text = u''.join(char for char in text if not unicodedata.combining(char))
+    text = u' '.join(text.split())
+    return ARTICLES.sub(u'', text) if articles else text
+
 
 def clean_filename(filename):
     space_chars = [' ', '-']
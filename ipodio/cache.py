@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Cache
+
+Persistent host-side storage for the hashes of local files, so files which
+were already hashed and did not change since are not read again.
+
+Entries are keyed by path and only trusted while the file keeps the same
+inode, size and modification time and the hash was computed with the same
+hashing parameters. The cache is bounded in number of entries; the least
+recently used ones are evicted when it is saved. A cache can be shared by
+several threads hashing at the same time.
+
+    # Load the cache from ~/.cache/ipodio (or $XDG_CACHE_HOME/ipodio)
+    cache = HashCache.create()
+
+    # Wrap any hasher so it checks the cache before reading the file
+    track = Track.create('/path/to/song', hasher=CachedHasher(Hasher(), cache))
+    track.update_hash()
+
+    # Store the new entries for the next time
+    cache.save()
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+
+
+def _key(path):
+    """Text form of the path, so JSON stores it whatever its encoding"""
+    if isinstance(path, unicode):
+        return path
+    try:
+        return path.decode(sys.getfilesystemencoding() or 'utf-8')
+    except UnicodeDecodeError:
+        # No path holds a NUL, so these never clash with decoded paths
+        return u'\0' + path.decode('latin-1')
+
+
+def cache_directory():
+    base = (os.environ.get('XDG_CACHE_HOME')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'ipodio')
+
+
+class HashCache(object):
+    def __init__(self, path=None, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = {}
+        self.updated = False
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path=None, max_entries=100000):
+        cache = cls(path or os.path.join(cache_directory(), 'hashes.json'),
+                    max_entries)
+        cache.load()
+        return cache
+
+    def _signature(self, path, tag):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_ino, stat.st_size, stat.st_mtime, tag]
+
+    def get(self, path, tag):
+        """Return a (signature, hash) pair; hash is None when not cached"""
+        signature = self._signature(path, tag)
+        with self.__lock:
+            entry = self.entries.get(_key(path))
+
+            if signature is None or not entry or entry[:4] != signature:
+                return signature, None
+
+            entry[5] = time.time()  # Only written along with other changes
+            return signature, entry[4]
+
+    def set(self, path, signature, hash):
+        if signature is None or hash is None:
+            return
+
+        with self.__lock:
+            self.entries[_key(path)] = signature + [hash, time.time()]
+            self.updated = True
+
+    def evict(self):
+        with self.__lock:
+            self.__evict()
+
+    def __evict(self):
+        excess = len(self.entries) - self.max_entries
+        if excess > 0:
+            by_usage = sorted(self.entries,
+                              key=lambda path: self.entries[path][5])
+            for path in by_usage[:excess]:
+                del self.entries[path]
+            self.updated = True
+
+    def load(self):
+        try:
+            with open(self.path) as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            entries = {}
+
+        with self.__lock:
+            self.entries = entries if isinstance(entries, dict) else {}
+            self.updated = False
+
+    def save(self):
+        """Atomically write the cache into its path"""
+        with self.__lock:
+            self.__save()
+
+    def __save(self):
+        if not self.updated:
+            return
+
+        self.__evict()
+
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'w') as cache_file:
+                json.dump(self.entries, cache_file, separators=(',', ':'))
+            os.rename(temporary, self.path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        self.updated = False
+
+
+class CachedHasher(object):
+    """Hasher wrapper which looks for the file in a HashCache before hashing"""
+
+    def __init__(self, hasher, cache):
+        self.hasher = hasher
+        self.cache = cache
+
+    @property
+    def name(self):
+        return self.hasher.name
+
+    def hash(self, filename):
+        signature, hash = self.cache.get(filename, self.name)
+
+        if hash is None:
+            hash = self.hasher.hash(filename)
+            self.cache.set(filename, signature, hash)
+
+        return hash
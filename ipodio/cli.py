@@ -3,27 +3,47 @@
 iPodio
 
 Usage:
-  ipodio list   [options] [<expression>...]
-  ipodio push   [options] [--force] [--recursive] <filename>...
+  ipodio list   [options] [--sort=<fields>] [<expression>...]
+  ipodio push   [options] [--force] [--recursive] [--no-hash-cache]
+                [--writers=<n>] [--resume] [--checkpoint=<n>]
+                [--exclude=<pattern>]...
+                [--fit] [--priority=<order>] [--plan] <filename>...
   ipodio pull   [options] [--dest=<directory>] [--force] [--plain] [<expression>...]
-  ipodio rm     [options] <expression>...
+  ipodio rm     [options] [<expression>...]
   ipodio rename [options] <expression> <replacement>
-  ipodio duplicates [options] [<expression>...]
-  ipodio playlist list [options] [--force] [<name>] [<expression>...]
+  ipodio duplicates [options] [--fuzzy] [--sort=<fields>] [<expression>...]
+  ipodio verify [options] [--rate-limit=<rate>] [<expression>...]
+  ipodio batch  [options] [<script>]
+  ipodio serve  [options]
+  ipodio playlist list [options] [--force] [--sort=<fields>] [<name>]
+                       [<expression>...]
   ipodio playlist create [options] <name>
-  ipodio playlist add [options] <name> <expression>...
+  ipodio playlist add [options] <name> [<expression>...]
   ipodio playlist rm [options] <name> [<expression>...]
   ipodio playlist rename [options] <name> <new_name>
 
 Options:
   -m PATH, --mount PATH  Path to the iPod's mountpoint.
   -y , --yes  Do not prompt the user with questions.
+  -j N, --jobs N  Number of files to hash at the same time.
+  --hash-algorithm NAME  Hash algorithm: sha1 (default), md5, crc32,
+                         adler32, blake2b. blake2b is only available on
+                         Python versions providing it.
+  --hash-bytes BYTES  Bytes of audio to hash, 0 to hash whole files.
+  --artist NAME  Select the tracks by this artist, ignoring case and accents.
+  --album NAME  Select the tracks from this album, ignoring case and accents.
+  --title NAME  Select the tracks with this title, ignoring case and accents.
+  --genre NAME  Select the tracks of this genre, ignoring case and accents.
 """
 
 import os
+import sys
+import shlex
+import signal
 
 from docopt import docopt
 
+from . import server
 from . import handlers
 from . import __version__
 
@@ -45,7 +65,7 @@ class Options(object):
         return options
 
     def _parse_options(self, options):
-        return {k.replace('-', ''): v
+        return {k.lstrip('-').replace('-', '_'): v
                 for k, v in options.items() if k.startswith('-')}
 
     def _parse_arguments(self, options):
@@ -86,26 +106,128 @@ class Command(object):
         return self.handler(**expected_args)
 
 
-def main():
-    defaults = {'mount': os.environ.get('IPODIO_MOUNTPOINT')}
-    parsed_input = docopt(__doc__, version=__version__)
-    options = Options(parsed_input, defaults)
-
-    router = Router(
+def batch(mount, script, jobs, hash_algorithm, hash_bytes):
+    """Run the commands in the script, or stdin, on a single database
+
+    Commands are written one per line as they would be given to ipodio,
+    with no prompts. The database is saved at the end and at every line
+    reading "checkpoint". Any error stops the batch without saving.
+    """
+    try:
+        lines = sys.stdin if script in (None, '-') else open(script)
+    except IOError as failure:
+        handlers.error('Cannot read "{}": {}'.format(script, failure))
+
+    try:
+        _run_batch(lines, mount, jobs, hash_algorithm, hash_bytes)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def _run_batch(lines, mount, jobs, hash_algorithm, hash_bytes):
+    session = handlers.start_session(mount, jobs, hash_algorithm, hash_bytes)
+    number = 0
+    try:
+        for number, line in enumerate(lines, 1):
+            argv = shlex.split(line, comments=True)
+            if not argv:
+                continue
+
+            if argv == ['checkpoint']:
+                session.save()
+                print('Checkpoint: saved at line {}'.format(number))
+            elif argv[0] == 'batch':
+                handlers.error('Batches cannot be nested')
+            else:
+                print('> ' + ' '.join(argv))
+                run(argv, mount=mount, yes=True)
+    except ValueError as invalid:  # Unbalanced quotes
+        _stop_batch(number, invalid)
+    except SystemExit as exit:  # Errors and usage messages
+        message = exit.code if isinstance(exit.code, basestring) else None
+        _stop_batch(number, message)
+
+    handlers.end_session()
+
+
+def _stop_batch(number, message=None):
+    handlers.end_session(save=False)
+    if message:
+        print(message)
+    print('Batch stopped at line {}, changes since the last checkpoint '
+          'were not saved'.format(number))
+    sys.exit(1)
+
+
+def serve(mount, jobs, hash_algorithm, hash_bytes):
+    """Keep the database loaded, running the commands forwarded to it"""
+    if not mount:
+        handlers.error('The mountpoint of the iPod to serve is needed')
+
+    def dispatch(argv):
+        run(argv, mount=mount)
+
+    # Stopping the server removes its socket
+    signal.signal(signal.SIGTERM, lambda number, frame: sys.exit(0))
+
+    print('Serving "{}" on {}'.format(mount, server.socket_path(mount)))
+    try:
+        server.Server(mount, dispatch, jobs, hash_algorithm,
+                      hash_bytes).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def make_router():
+    return Router(
         Command(['rm'], handlers.rm),
         Command(['list'], handlers.list),
         Command(['push'], handlers.push),
         Command(['pull'], handlers.pull),
         Command(['rename'], handlers.rename),
         Command(['duplicates'], handlers.duplicates),
+        Command(['verify'], handlers.verify),
         Command(['playlist', 'list'], handlers.playlist),
         Command(['playlist', 'add'], handlers.playlist_add),
         Command(['playlist', 'rm'], handlers.playlist_rm),
         Command(['playlist', 'rename'], handlers.playlist_rename),
-        Command(['playlist', 'create'], handlers.playlist_create)
+        Command(['playlist', 'create'], handlers.playlist_create),
+        Command(['batch'], batch),
+        Command(['serve'], serve)
     )
 
-    command = router.get_command(options.active_commands)
+
+def run(argv=None, defaults=None, **overrides):
+    """Parse the command line and call its handler"""
+    options = Options(docopt(__doc__, argv=argv, version=__version__),
+                      defaults)
+    options.data.update(overrides)
+
+    command = make_router().get_command(options.active_commands)
+    return command.call(**options.data)
+
+
+def _forward(options):
+    """Run read-only commands within a server for the iPod, if there is one.
+    Commands changing the hashing options run by themselves."""
+    data = options.data
+    if (data.get('mount')
+            and frozenset(options.active_commands) in server.FORWARDED_COMMANDS
+            and data.get('hash_algorithm') is None
+            and data.get('hash_bytes') is None):
+        return server.forward(data['mount'], sys.argv[1:])
+
+
+def main():
+    defaults = {'mount': os.environ.get('IPODIO_MOUNTPOINT')}
+    options = Options(docopt(__doc__, version=__version__), defaults)
+
+    status = _forward(options)
+    if status is not None:
+        sys.exit(status)
+
+    command = make_router().get_command(options.active_commands)
     command.call(**options.data)
 
 if __name__ == '__main__':
@@ -9,6 +9,7 @@ import termios
 
 class Console(object):
     _width = None
+    forced_width = None  # Width of the terminal output is written for
 
     def _get_console_size(self):
         return (self._get_window_size(sys.stdin)
@@ -34,6 +35,8 @@ class Console(object):
 
     @property
     def width(self):
+        if Console.forced_width:
+            return Console.forced_width
         if self._width is None:
             _, self._width = self._get_console_size()
         return self._width
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Copier
+
+Copies music files into the iPod, in place of libgpod's copy_delayed_files
+which copies them one at a time through small buffers.
+
+Files are placed in one of the iPod_Control/Music/Fxx directories under a
+random name, as iTunes and libgpod do. Data is moved within the kernel by
+copy_file_range or sendfile when the C library provides them, or otherwise
+read and written through a large buffer. Files are flushed to the device in
+batches instead of one by one, as every flush waits for the device.
+
+    copier = Copier('/ipod/mountpoint')
+
+    # Copy the file, return its iPod path as :iPod_Control:Music:F00:ABCD.mp3
+    ipod_path = copier.copy('/path/to/song.mp3')
+
+    # Flush the files copied so far
+    copier.sync()
+
+    print(copier.bytes, copier.seconds)
+
+    # Bytes which can still be copied, leaving room for the iTunesDB
+    free_space('/ipod/mountpoint')
+
+    # Bytes per second the iPod takes, writing a short file into it
+    measure_write_rate('/ipod/mountpoint')
+
+A copier can be shared by several threads writing at the same time.
+"""
+
+import os
+import re
+import time
+import errno
+import random
+import string
+import tempfile
+import threading
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+except (ImportError, OSError, TypeError):  # Not a POSIX system
+    ctypes = _libc = None
+
+
+MUSIC_DIRECTORY = os.path.join('iPod_Control', 'Music')
+MUSIC_SUBDIRECTORY = re.compile(r'^F\d\d$')
+
+BUFFER_SIZE = 1024 * 1024  # A multiple of the page and block sizes
+SYNC_EVERY = 16  # Files
+
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_DONTNEED = 4
+
+# Errors telling a system call cannot copy between the given files
+UNSUPPORTED = frozenset([errno.ENOSYS, errno.EINVAL, errno.EXDEV,
+                         errno.EOPNOTSUPP, errno.EBADF])
+
+
+def _function(name, restype, *argtypes):
+    function = getattr(_libc, name, None)
+    if function is not None:
+        function.restype = restype
+        function.argtypes = argtypes
+    return function
+
+
+if _libc is not None:
+    _copy_file_range = _function(
+        'copy_file_range', ctypes.c_ssize_t, ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint)
+    _sendfile = _function(
+        'sendfile64', ctypes.c_ssize_t, ctypes.c_int, ctypes.c_int,
+        ctypes.c_void_p, ctypes.c_size_t)
+    _fadvise = _function(
+        'posix_fadvise64', ctypes.c_int, ctypes.c_int, ctypes.c_int64,
+        ctypes.c_int64, ctypes.c_int)
+else:
+    _copy_file_range = _sendfile = _fadvise = None
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _advise(descriptor, advice):
+    """Hint the kernel about how the file will be used, when possible"""
+    if _fadvise is not None:
+        _fadvise(descriptor, 0, 0, advice)
+
+
+def _call(function, *args):
+    """Run a copying system call, return the number of bytes it copied"""
+    copied = function(*args)
+    if copied < 0:
+        number = ctypes.get_errno()
+        raise OSError(number, os.strerror(number))
+    return copied
+
+
+def _kernel_copy(function, source, target, size):
+    if function is _copy_file_range:
+        def copy(count):
+            return _call(function, source, None, target, None, count, 0)
+    else:
+        def copy(count):
+            return _call(function, target, source, None, count)
+
+    copied = 0
+    while copied < size:
+        try:
+            count = copy(min(size - copied, 1 << 30))
+        except OSError as failure:
+            if copied == 0 and failure.errno in UNSUPPORTED:
+                raise _Unsupported()
+            raise
+        if count == 0:
+            break  # The file was truncated meanwhile
+        copied += count
+    return copied
+
+
+def _buffered_copy(source, target, buffer_size):
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    copied = 0
+    with os.fdopen(os.dup(source), 'rb', 0) as source_file:
+        while True:
+            count = source_file.readinto(buffer)
+            if not count:
+                return copied
+            written = 0
+            while written < count:
+                written += os.write(target, view[written:count])
+            copied += count
+
+
+def copy_data(source, target, size, buffer_size=BUFFER_SIZE):
+    """Copy size bytes between the descriptors the fastest way available
+
+    Returns the bytes copied, which may be more or less than size if the
+    source changed meanwhile.
+    """
+    for function in (_copy_file_range, _sendfile):
+        if function is not None:
+            try:
+                return _kernel_copy(function, source, target, size)
+            except _Unsupported:
+                pass
+    return _buffered_copy(source, target, buffer_size)
+
+
+# Left free for the iTunesDB and the artwork database to grow
+RESERVED_SPACE = 16 * 1024 * 1024
+
+
+def free_space(mountpoint, reserved=RESERVED_SPACE):
+    """Bytes which can be written into the iPod, None if unknown"""
+    try:
+        stat = os.statvfs(mountpoint)
+    except (OSError, AttributeError):  # Not mounted, or not a POSIX system
+        return None
+    return max(stat.f_bavail * stat.f_frsize - reserved, 0)
+
+
+BENCHMARK_SIZE = 16 * 1024 * 1024
+
+
+def measure_write_rate(mountpoint, size=BENCHMARK_SIZE,
+                       buffer_size=BUFFER_SIZE):
+    """Bytes per second written and flushed into the iPod, None if unknown"""
+    directory = os.path.join(mountpoint, 'iPod_Control')
+    if not os.path.isdir(directory):
+        directory = mountpoint
+
+    try:
+        descriptor, path = tempfile.mkstemp(prefix='ipodio', dir=directory)
+    except (OSError, IOError):
+        return None
+
+    block = b'\0' * buffer_size
+    try:
+        start = time.time()
+        written = 0
+        while written < size:
+            written += os.write(descriptor, block[:size - written])
+        os.fsync(descriptor)
+        seconds = time.time() - start
+    except (OSError, IOError):
+        return None
+    finally:
+        os.close(descriptor)
+        os.remove(path)
+
+    return written / seconds if seconds > 0 else None
+
+
+class Copier(object):
+    def __init__(self, mountpoint, sync_every=SYNC_EVERY,
+                 buffer_size=BUFFER_SIZE):
+        self.mountpoint = mountpoint
+        self.sync_every = sync_every
+        self.buffer_size = buffer_size
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0  # While copying or syncing
+        self.__directories = None
+        self.__pending = []  # Descriptors of the files to sync
+        self.__active = 0
+        self.__busy_since = None
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """Bytes copied per second"""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __start(self):
+        with self.__lock:
+            if not self.__active:
+                self.__busy_since = time.time()
+            self.__active += 1
+
+    def __stop(self, files=0, bytes=0):
+        with self.__lock:
+            self.files += files
+            self.bytes += bytes
+            self.__active -= 1
+            if not self.__active:
+                self.seconds += time.time() - self.__busy_since
+
+    def _music_directories(self):
+        if self.__directories is None:
+            base = os.path.join(self.mountpoint, MUSIC_DIRECTORY)
+            try:
+                names = [name for name in os.listdir(base)
+                         if MUSIC_SUBDIRECTORY.match(name)]
+            except OSError:
+                names = []
+            if not names:
+                names = ['F00']
+                if not os.path.isdir(os.path.join(base, 'F00')):
+                    os.makedirs(os.path.join(base, 'F00'))
+            self.__directories = sorted(names)
+        return self.__directories
+
+    def _create(self, extension):
+        """Open a new file with a random name, return it and its iPod path"""
+        directory = random.choice(self._music_directories())
+        while True:
+            name = u''.join(random.choice(string.ascii_uppercase)
+                            for _ in range(4)) + extension
+            path = os.path.join(self.mountpoint, MUSIC_DIRECTORY, directory,
+                                name)
+            try:
+                descriptor = os.open(
+                    path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except OSError as failure:
+                if failure.errno == errno.EEXIST:
+                    continue
+                raise
+            ipod_path = u':' + u':'.join(
+                MUSIC_DIRECTORY.split(os.sep) + [directory, name])
+            return descriptor, path, ipod_path
+
+    def copy(self, filename):
+        """Copy the file into the iPod, return its iPod path
+
+        Raises IOError, leaving nothing in the iPod, when the file changed
+        size while being copied.
+        """
+        self.__start()
+        copied = None
+        try:
+            source = os.open(filename, os.O_RDONLY)
+            try:
+                size = os.fstat(source).st_size
+                _advise(source, POSIX_FADV_SEQUENTIAL)
+
+                extension = os.path.splitext(filename)[1].lower()
+                target, path, ipod_path = self._create(extension)
+                try:
+                    count = copy_data(source, target, size, self.buffer_size)
+                    if count != size:
+                        raise IOError(errno.EIO, 'Copied {} of the {} bytes '
+                                      'of "{}", which changed meanwhile'
+                                      .format(count, size, filename))
+                except BaseException:
+                    os.close(target)
+                    os.remove(path)
+                    raise
+
+                copied = count
+                _advise(source, POSIX_FADV_DONTNEED)  # Read just once
+            finally:
+                os.close(source)
+
+            self.__defer_sync(target)
+        finally:
+            self.__stop(files=int(copied is not None), bytes=copied or 0)
+
+        return ipod_path
+
+    def __defer_sync(self, descriptor):
+        with self.__lock:
+            self.__pending.append(descriptor)
+            full = len(self.__pending) >= self.sync_every
+        if full:
+            self.sync()
+
+    def sync(self):
+        """Flush the files copied so far into the device"""
+        with self.__lock:
+            pending, self.__pending = self.__pending, []
+        if not pending:
+            return
+
+        self.__start()
+        try:
+            failure = None
+            for descriptor in pending:
+                try:
+                    os.fsync(descriptor)
+                    _advise(descriptor, POSIX_FADV_DONTNEED)
+                except OSError as error:
+                    failure = failure or error
+                finally:
+                    os.close(descriptor)
+            if failure is not None:
+                raise failure
+        finally:
+            self.__stop()
@@ -14,17 +14,55 @@ cleaner interface, extra functionality and resolve some flaws.
     # Index all tracks by its hash.
     # The chosen structure is a dictionary of sets,
     # which might be regarded as # a multi-dict.
-    database.update_index()
+    # Missing hashes can be computed by several threads.
+    # Tracks keep the name of the hasher which computed their hash
+    # so libraries hashed with several hashers can still be indexed.
+    database.update_index(jobs=4)
+
+    # Tracks hashed by other hashers are hashed again by the database hasher
+    # only once their hash is needed, e.g. to find duplicates.
+    database.get_hash(track)
+
+    # Databases opened by Database.create('/ipod/mountpoint') also keep the
+    # hashes in a sidecar file next to the iTunesDB, so the index is loaded
+    # from it the next time instead of from every track.
+
+    # The index is kept up to date as tracks are added, removed or hashed
+    # again, as a reverse map tells the hash each track is indexed by.
 
     # The indexing allows to get a database by its inner contents
     # and thus making it easy to detect and avoid duplication.
     database.get_by_hash('some_calculated_track_hash')
 
+    # Tracks are wrapped once, so the same ipodio.Track instance is returned
+    # by database.tracks, its playlists and the index, and can be looked up
+    # by the gpod dbid.
+    database.get_by_dbid(track.dbid)
+
+    # Tracks can be found by their exact artist, album, title or genre,
+    # ignoring case and accents, through indexes built the first time they
+    # are used.
+    database.find_by_fields(artist='john lennon', album='imagine')
+
+    # The indexes are kept up to date when those fields are changed, as long
+    # as the database takes the new snapshot of the track.
+    track.internal['artist'] = 'Lennon'
+    database.refresh(track)
+
+    # Playlists are kept by name, and know which tracks they hold so adding a
+    # track twice does nothing.
+    playlist = database.get_playlist('name')
+    playlist.extend(database.tracks)
+
     # Basic operations along with a ipodio.Track instance
     database.get(track)
     database.add(track)
     database.remove(track)
 
+    # Read-only commands can use a pure Python iTunesDB reader instead of
+    # libgpod, see ipodio.itunesdb
+    database = Database.create('/ipod/mountpoint', internal_class=ITunesDB)
+
     # The gpod Database reference is public until those use cases which need it
     # are sorted out and implemented as part of the class.
     database.internal
@@ -33,14 +71,22 @@ cleaner interface, extra functionality and resolve some flaws.
     # so unnecessary expensive closing work is spared by checking.
     if database.updated:
         database.copy_files()   # Physically send track files if needed
+                                # or send them one by one with copy_file
         database.save()         # Save the current database state and store it
 """
 
-import gpod
-
+from itertools import izip
 from collections import defaultdict
 
-from .track import Track
+from ._helpers import fold
+from .track import Track, require_gpod
+from .hashing import Hasher
+from .sidecar import Sidecar
+from .copier import Copier
+from .workers import imap
+
+
+FIELDS = ('artist', 'album', 'title', 'genre')
 
 
 def first(iterable):
@@ -48,13 +94,65 @@ def first(iterable):
         return item
 
 
+def _group_by(key, tracks):
+    groups = defaultdict(list)
+    for track in tracks:
+        groups[key(track)].append(track)
+
+    return [group for value, group in groups.iteritems()
+            if value is not None and len(group) > 1]
+
+
+def _regroup(groups, key):
+    return [subgroup for group in groups for subgroup in _group_by(key, group)]
+
+
+def _with_similar_length(tracks, tolerance):
+    """The tracks whose length is within tolerance of another track's, or
+    whose size equals another's when their length is unknown"""
+    width = tolerance + 1  # Lengths within a bucket are close enough
+    buckets = defaultdict(list)
+    for track in tracks:
+        if track.length:
+            buckets[track.length // width].append(track)
+
+    similar = []
+    for bucket, members in buckets.iteritems():
+        if len(members) > 1:
+            similar.extend(members)
+            continue
+
+        track, = members
+        neighbours = buckets.get(bucket - 1, []) + buckets.get(bucket + 1, [])
+        if any(abs(track.length - other.length) <= tolerance
+               for other in neighbours):
+            similar.append(track)
+
+    for group in _group_by(lambda track: track.size,
+                           [track for track in tracks if not track.length]):
+        similar.extend(group)
+
+    return similar
+
+
+def _member_key(track):
+    """Tracks are told apart by dbid, or by wrapper for those lacking it"""
+    return track.dbid or track
+
+
 class Playlist(object):
-    def __init__(self, playlist):
+    def __init__(self, playlist, database=None):
         self.__playlist = playlist
+        self.__database = database
+        self.__members = None  # The keys of its tracks, built on demand
 
     @classmethod
-    def create(cls, name, database, internal_class=gpod.Playlist):
-        return cls(internal_class(database.internal, name))
+    def create(cls, name, database, internal_class=None):
+        internal_class = internal_class or require_gpod().Playlist
+        playlist = cls(internal_class(database.internal, name),
+                       database=database)
+        database.add_playlist(playlist)
+        return playlist
 
     @property
     def internal(self):
@@ -74,53 +172,271 @@ class Playlist(object):
 
     @property
     def tracks(self):
-        return [Track(track) for track in self.__playlist]
+        if self.__database is None:
+            return [Track(track) for track in self.__playlist]
+        return [self.__database.wrap(track) for track in self.__playlist]
+
+    def __membership(self):
+        if self.__members is None:
+            self.__members = set(_member_key(track) for track in self.tracks)
+        return self.__members
+
+    def __contains__(self, track):
+        return _member_key(track) in self.__membership()
 
     def append(self, track):
-        self.__playlist.add(track.internal)
+        """Add the track unless the playlist already holds it"""
+        key = _member_key(track)
+        if key not in self.__membership():
+            self.__playlist.add(track.internal)
+            self.__members.add(key)
 
     def extend(self, tracks):
         map(self.append, tracks)
 
     def remove(self, track):
-        self.__playlist.remove(track.internal)
+        key = _member_key(track)
+        if key in self.__membership():
+            self.__playlist.remove(track.internal)
+            self.__members.discard(key)
 
     def discard(self, tracks):
         map(self.remove, tracks)
 
 
 class Database(object):
-    def __init__(self, database):
+    def __init__(self, database, hasher=None, sidecar=None, copier=None):
         self.__database = database
+        self.hasher = hasher or Hasher()
+        self.sidecar = sidecar
+        self.copier = copier
         self.index = defaultdict(set)
+        self.__hashes = {}  # The hash each track is indexed by
+        self.hash_names = set()
         self.updated = False
+        # The sidecar contents as {dbid: (hash, hasher name)}, loaded on demand
+        self.__stored = None
+        self.__tracks = None  # The canonical Track wrappers, built on demand
+        self.__by_dbid = {}
+        # {field: {folded value: [tracks]}}, built on demand
+        self.__fields = {}
+        self.__playlists = None  # The Playlist wrappers, built on demand
+        self.__playlists_by_name = {}
 
     @classmethod
-    def create(cls, mountpoint, internal_class=gpod.Database):
-        return cls(internal_class(mountpoint))
+    def create(cls, mountpoint, internal_class=None, hasher=None):
+        internal_class = internal_class or require_gpod().Database
+        return cls(internal_class(mountpoint), hasher=hasher,
+                   sidecar=Sidecar.create(mountpoint),
+                   copier=Copier(mountpoint))
 
     @property
     def internal(self):
         return self.__database
 
+    def __wrap(self, internal):
+        try:
+            dbid = internal['dbid']
+        except KeyError:
+            dbid = None
+        return (dbid and self.__by_dbid.get(dbid)
+                or Track(internal, hasher=self.hasher))
+
+    def __wrappers(self):
+        """Wrap the gpod tracks, keeping the wrappers of known tracks"""
+        if self.__tracks is None:
+            self.__tracks = [self.__wrap(track) for track in self.__database]
+            self.__by_dbid = {track.dbid: track for track in self.__tracks
+                              if track.dbid}
+        return self.__tracks
+
+    def wrap(self, internal):
+        """Return the Track wrapping the given gpod track"""
+        self.__wrappers()
+        return self.__wrap(internal)
+
     @property
     def tracks(self):
-        return [Track(track) for track in self.__database]
+        # A copy, as callers are free to sort or filter it
+        return list(self.__wrappers())
+
+    def __field_index(self, field):
+        if field not in FIELDS:
+            raise ValueError(u'Unknown field "{}"'.format(field))
+
+        if field not in self.__fields:
+            index = defaultdict(list)
+            for track in self.__wrappers():
+                index[fold(getattr(track, field))].append(track)
+            self.__fields[field] = index
+
+        return self.__fields[field]
+
+    def __index_fields(self, track):
+        for field, index in self.__fields.iteritems():
+            index[fold(getattr(track, field))].append(track)
+
+    def __unindex_fields(self, track):
+        for field, index in self.__fields.iteritems():
+            value = fold(getattr(track, field))
+            group = index.get(value, [])
+            if track in group:
+                group.remove(track)
+                if not group:
+                    del index[value]
+
+    def refresh(self, track):
+        """Snapshot the fields of the track again after writing them"""
+        self.__unindex_fields(track)
+        track.refresh()
+        self.__index_fields(track)
+
+    def find_by_fields(self, **fields):
+        """Tracks whose fields equal the given values, ignoring case and
+        accents"""
+        if not fields:
+            return self.tracks
+
+        values = {field: fold(value) for field, value in fields.iteritems()}
+        groups = sorted(((self.__field_index(field).get(value, ()), field)
+                         for field, value in values.iteritems()),
+                        key=lambda pair: len(pair[0]))
+
+        smallest, field = groups[0]
+        del values[field]
+
+        return [track for track in smallest
+                if all(fold(getattr(track, name)) == value
+                       for name, value in values.iteritems())]
+
+    def get_by_dbid(self, dbid):
+        self.__wrappers()
+        return self.__by_dbid.get(dbid)
+
+    def __playlist_wrappers(self):
+        if self.__playlists is None:
+            self.__playlists = [Playlist(playlist, database=self)
+                                for playlist in self.__database.Playlists]
+            self.__index_playlist_names()
+        return self.__playlists
+
+    def __index_playlist_names(self):
+        # The first of several playlists with the same name is the one found
+        self.__playlists_by_name = {}
+        for playlist in reversed(self.__playlists):
+            self.__playlists_by_name[playlist.name] = playlist
 
     @property
     def playlists(self):
-        return [Playlist(playlist) for playlist in self.__database.Playlists]
+        return list(self.__playlist_wrappers())
+
+    def get_playlist(self, name):
+        self.__playlist_wrappers()
+        return self.__playlists_by_name.get(name)
+
+    def add_playlist(self, playlist):
+        """Keep track of a playlist just created within the gpod database"""
+        self.updated = True
+        self.__playlist_wrappers().append(playlist)
+        self.__playlists_by_name.setdefault(playlist.name, playlist)
+
+    def rename_playlist(self, playlist, name):
+        self.updated = True
+        playlist.name = name
+        self.__playlist_wrappers()
+        self.__index_playlist_names()
 
     def __add_index(self, track):
         if not track.hash:
             self.updated = True
             track.update_hash()
 
-        self.index[track.hash].add(track)
+        self.__index(track, track.hash, track.hash_name)
+
+    def __index(self, track, hash, name):
+        self.__unindex(track)
+        self.__hashes[track] = hash
+        self.index[hash].add(track)
+        self.hash_names.add(name)
+        self.__store(track, hash, name)
+
+    def __stored_hashes(self):
+        if self.__stored is None:
+            stored = self.sidecar.load() if self.sidecar else None
+            self.__stored = stored or {}
+        return self.__stored
+
+    def __store(self, track, hash, name):
+        if track.dbid:
+            self.__stored_hashes()[track.dbid] = (hash, name)
+
+    def __unindex(self, track):
+        hash = self.__hashes.pop(track, None)
+        group = self.index.get(hash)
+        if group is not None:
+            group.discard(track)
+            if not group:
+                del self.index[hash]
+
+    def __stale(self, track):
+        """Whether the track lacks a hash by the database hasher"""
+        hash, name = self.stored_hash(track)
+        return not hash or name != self.hasher.name
+
+    def __hash(self, tracks, jobs):
+        hashes = imap(Track.compute_hash, tracks, jobs)
+        for track, hash in izip(tracks, hashes):
+            self.updated = True
+            track.hash = hash
+            track.hash_name = self.hasher.name
+            if track in self.__hashes:
+                self.__index(track, hash, track.hash_name)
+            else:
+                self.__store(track, hash, track.hash_name)
+
+    def update_index(self, jobs=1):
+        """Index every track by its hash, hashing the tracks which lack one
 
-    def update_index(self):
+        Tracks hashed by other hashers are indexed as they are, and only
+        hashed again by get_hash once their hash is needed.
+
+        Hashes are taken from the sidecar file when it is up to date, and
+        the file is written again if any track had to be read.
+        """
+        stored = self.__stored_hashes()
+
+        pending = []
         for track in self.tracks:
-            self.__add_index(track)
+            hash, name = stored.get(track.dbid, (None, None))
+            if hash:
+                self.__index(track, hash, name)
+            else:
+                pending.append(track)
+
+        self.__hash([track for track in pending if not track.hash], jobs)
+
+        for track in pending:
+            self.__index(track, track.hash, track.hash_name)
+
+        if pending:
+            self.__save_sidecar()
+
+    def __save_sidecar(self):
+        if self.sidecar and self.__stored is not None:
+            self.sidecar.save(self.__stored)
+
+    def stored_hash(self, track):
+        """The (hash, hasher name) of the track, as kept in the sidecar file
+        or otherwise in the track itself"""
+        stored = self.__stored_hashes().get(track.dbid) if track.dbid else None
+        return stored or (track.hash, track.hash_name)
+
+    def get_hash(self, track):
+        """The hash of the track by the database hasher, hashing it again
+        if it was hashed by another one"""
+        if self.__stale(track):
+            self.__hash([track], jobs=1)
+        return self.stored_hash(track)[0]
 
     def get(self, track):
         return self.get_by_hash(track.hash)
@@ -129,24 +445,70 @@ class Database(object):
         return first(self.find_by_hash(hash))
 
     def find_by_hash(self, hash):
-        return self.index[hash]
+        return self.index.get(hash, set())
 
     def add(self, track):
         self.updated = True
-        self.__add_index(track)
+        tracks = self.__wrappers()  # Before the track is there to be wrapped
         self.__database.add(track.internal)
         self.__database.Master.add(track.internal)
+        tracks.append(track)
+        self.__index_fields(track)
+        if track.dbid:
+            self.__by_dbid[track.dbid] = track
+        self.__add_index(track)
 
     @property
     def duplicates(self):
         return [group for group in self.index.itervalues() if len(group) > 1]
 
+    def find_duplicates(self, jobs=1, tolerance=0):
+        """Group the tracks with the same audio, reading the fewest files
+
+        Only tracks whose length is within `tolerance` milliseconds of
+        another track's, the same length by default, or whose file size
+        equals another's when their length is unknown, are hashed. Tracks
+        sharing a partial hash are finally compared by the hash of their
+        whole audio.
+
+        Hashes are taken from the sidecar file, and the file is written
+        again if any track had to be read.
+        """
+        candidates = _with_similar_length(self.tracks, tolerance)
+
+        stale = [track for track in candidates if self.__stale(track)]
+        self.__hash(stale, jobs)
+        if stale:
+            self.__save_sidecar()
+
+        hashes = {track: self.stored_hash(track)[0] for track in candidates}
+        groups = _group_by(hashes.get, candidates)
+
+        if self.hasher.maxbytes is not None:
+            full_hasher = Hasher(self.hasher.algorithm, maxbytes=None)
+            tracks = [track for group in groups for track in group]
+            hashes = dict(izip(tracks, imap(
+                lambda track: full_hasher.hash(track.filename), tracks, jobs)))
+            groups = _regroup(groups, hashes.get)
+
+        return groups
+
     def remove(self, track):
         self.updated = True
+        self.__stored_hashes().pop(track.dbid, None)
+        self.__unindex(track)
         self.__database.remove(track.internal, quiet=True)
+        if self.__tracks is not None and track in self.__tracks:
+            self.__tracks.remove(track)
+        if track.dbid and self.__by_dbid.get(track.dbid) is track:
+            del self.__by_dbid[track.dbid]
+        self.__unindex_fields(track)
 
     def remove_playlist(self, playlist):
         self.updated = True
+        if self.__playlists is not None and playlist in self.__playlists:
+            self.__playlists.remove(playlist)
+            self.__index_playlist_names()
         # Avoid physically removing tracks from the iPod by setting ipod=False
         # This may orphan tracks if they were only in this playlist
         self.__database.remove(playlist.internal, quiet=True, ipod=False)
@@ -154,5 +516,22 @@ class Database(object):
     def copy_files(self, progress=None):
         self.__database.copy_delayed_files(progress)
 
+    def copy_file(self, track):
+        """Physically send the file of an added track, ahead of copy_files
+
+        Files are copied by the ipodio.Copier when there is one, and flushed
+        into the device by sync_files.
+        """
+        if self.copier is None:
+            track.internal.copy_to_ipod()
+        else:
+            track.copied_to(self.copier.copy(track.filename))
+
+    def sync_files(self):
+        if self.copier is not None:
+            self.copier.sync()
+
     def save(self):
+        self.sync_files()
         self.__database.close()
+        self.__save_sidecar()
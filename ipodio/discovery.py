@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Discovery
+
+Finds the music files to push within the files and directories given, as
+they are needed, so the first ones can be read while the rest of the tree is
+still being walked.
+
+Only files with the extension of a format the iPod plays are taken from the
+directories, so covers, playlists or notes are never parsed. Their first bytes
+can be checked too, before they are given to libgpod, as parsing a file which
+is not music is much more expensive than telling it apart.
+
+    for path in find_files(['Albums/', 'song.mp3'], recursive=True,
+                           exclude=['*/Demos/*', '*.live.mp3']):
+        if is_audio(path):
+            print(path)
+
+Directories are listed with scandir, which tells files from directories
+without a stat for each one, when it is available.
+"""
+
+import os
+import fnmatch
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir  # The backport for Python 2
+    except ImportError:
+        scandir = None
+
+
+AUDIO_EXTENSIONS = frozenset([
+    '.mp3', '.m4a', '.m4b', '.m4p', '.aac', '.aif', '.aiff', '.wav',
+])
+
+FILE, DIRECTORY = 'file', 'directory'
+
+
+def _excluded(path, exclude):
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern)
+               for pattern in exclude)
+
+
+def _scan(directory):
+    for entry in scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            yield entry.name, DIRECTORY
+        elif entry.is_file():
+            yield entry.name, FILE
+
+
+def _list(directory):
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            yield name, DIRECTORY
+        elif os.path.isfile(path):
+            yield name, FILE
+
+
+def _entries(directory):
+    """(name, kind) of the entries in the directory, sorted by name"""
+    try:
+        return sorted(_scan(directory) if scandir else _list(directory))
+    except OSError:
+        return []  # Unreadable, as os.walk does
+
+
+def _walk(top, recursive, exclude, extensions):
+    pending = [top]
+    while pending:
+        directory = pending.pop()
+        subdirectories = []
+        for name, kind in _entries(directory):
+            path = os.path.join(directory, name)
+            if _excluded(path, exclude):
+                continue
+            if kind == DIRECTORY:
+                subdirectories.append(path)
+            elif os.path.splitext(name)[1].lower() in extensions:
+                yield path
+
+        if recursive:
+            pending.extend(reversed(subdirectories))
+
+
+def find_files(paths, recursive=False, exclude=(),
+               extensions=AUDIO_EXTENSIONS):
+    """Yield the files given, then the music files within the directories
+
+    Paths matching any of the exclude glob patterns, by their name or their
+    whole path, are skipped along with their contents.
+    """
+    directories = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            if not _excluded(path, exclude):
+                yield path
+        elif os.path.isdir(path) and not _excluded(path, exclude):
+            directories.append(path)
+
+    for directory in directories:
+        for path in _walk(directory, recursive, exclude, extensions):
+            yield path
+
+
+def is_audio(path):
+    """Whether the first bytes of the file belong to a format the iPod plays"""
+    with open(path, 'rb') as song:
+        head = song.read(12)
+
+    return (head[:3] == b'ID3'                       # MP3 with ID3v2 tag
+            or head[4:8] == b'ftyp'                  # MPEG-4 audio
+            or head[:4] == b'FORM'                   # AIFF
+            or head[:4] == b'RIFF' and head[8:12] == b'WAVE'
+            or head[:4] == b'ADIF'                   # Raw AAC
+            or len(head) >= 2 and ord(head[0:1]) == 0xFF
+            and ord(head[1:2]) & 0xE0 == 0xE0)       # MPEG or ADTS frame
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Fuzzy
+
+Finds tracks which are likely the same song by their tags and length, such as
+the same song encoded at different bitrates, which hashing their audio cannot
+detect. Titles, artists and albums are compared ignoring annotations such as
+"(Remastered 2010)", but not those telling another version of the song, such
+as "(Live)" or "(Remix)". Tracks of different versions, or whose lengths are
+further apart than the tolerance, are never the same song.
+
+Comparing every pair of tracks does not scale, so each track is only compared
+with those sharing one of its blocking keys: its normalised artist and title,
+or its normalised title and approximate length. Blocks which are too big to be
+meaningful (e.g. every track titled "Intro") are not compared at all.
+
+    for score, tracks in find_similar(database.tracks, threshold=0.8):
+        print(score, tracks)
+"""
+
+import re
+from difflib import SequenceMatcher
+from collections import defaultdict
+
+from ._helpers import fold
+
+
+PARENTHESES = re.compile(r'\(.*?\)|\[.*?\]', re.UNICODE)
+FEATURING = re.compile(r'\b(feat|ft|featuring)\b.*$', re.UNICODE)
+PUNCTUATION = re.compile(r'[^\w\s]', re.UNICODE)
+VERSIONS = re.compile(r'\b(live|remix|mix|acoustic|demo|instrumental|'
+                      r'unplugged|karaoke|reprise)\b', re.UNICODE)
+
+# Weights of the similarity of each field, among those both tracks have
+WEIGHTS = {'title': 0.45, 'artist': 0.25, 'album': 0.1, 'length': 0.2}
+
+
+def _annotation(match):
+    """The annotation when it tells another version of the song"""
+    return match.group() if VERSIONS.search(match.group()) else u' '
+
+
+def normalize(text):
+    """Lowercase text without accents, punctuation, articles or annotations
+    other than those telling the version of a song"""
+    text = PARENTHESES.sub(_annotation, fold(text))
+    text = FEATURING.sub(u' ', text)
+    text = PUNCTUATION.sub(u' ', text)
+    return fold(text, articles=True)
+
+
+def versions(text):
+    """The words of the normalised text telling the version of a song"""
+    return frozenset(VERSIONS.findall(text))
+
+
+class _Candidate(object):
+    def __init__(self, track):
+        self.track = track
+        self.title = normalize(track.title)
+        self.artist = normalize(track.artist)
+        self.album = normalize(track.album)
+        self.length = track.length
+        self.versions = versions(self.title)
+
+    def blocking_keys(self, length_bucket):
+        if self.title:
+            yield ('artist', self.artist, self.title)
+
+            # Two overlapping length buckets so lengths within half a bucket
+            # always share one of them
+            if self.length:
+                yield ('length', self.title, self.length // length_bucket)
+                yield ('half', self.title,
+                       (self.length + length_bucket // 2) // length_bucket)
+
+
+def _similarity(first, second):
+    if first == second:
+        return 1.0
+    return SequenceMatcher(None, first, second).ratio()
+
+
+def score(first, second, tolerance=5000):
+    """Likelihood in [0, 1] of two candidates being the same song
+
+    Candidates of different versions, or whose lengths differ by more than
+    `tolerance` milliseconds, score 0.
+    """
+    if first.versions != second.versions:
+        return 0.0
+
+    similarities = {'title': _similarity(first.title, second.title),
+                    'artist': _similarity(first.artist, second.artist)}
+
+    if first.album and second.album:
+        similarities['album'] = _similarity(first.album, second.album)
+
+    if first.length and second.length:
+        difference = abs(first.length - second.length)
+        if difference > tolerance:
+            return 0.0
+        similarities['length'] = 1.0 - float(difference) / tolerance
+
+    weights = sum(WEIGHTS[field] for field in similarities)
+    return sum(WEIGHTS[field] * similarity
+               for field, similarity in similarities.iteritems()) / weights
+
+
+def _blocks(candidates, length_bucket, max_block):
+    blocks = defaultdict(list)
+    for candidate in candidates:
+        for key in candidate.blocking_keys(length_bucket):
+            blocks[key].append(candidate)
+
+    return [block for block in blocks.itervalues()
+            if 1 < len(block) <= max_block]
+
+
+def _find(parents, element):
+    while parents[element] is not element:
+        parents[element] = parents[parents[element]]
+        element = parents[element]
+    return element
+
+
+def find_similar(tracks, threshold=0.8, tolerance=5000, max_block=50):
+    """Return (score, tracks) groups of tracks which are likely the same song
+
+    Lengths are compared within `tolerance` milliseconds. Groups are scored
+    by the least similar pair of tracks which joined them.
+    """
+    candidates = [_Candidate(track) for track in tracks]
+    parents = {candidate: candidate for candidate in candidates}
+    scores = {}
+
+    for block in _blocks(candidates, tolerance, max_block):
+        for position, first in enumerate(block):
+            for second in block[position + 1:]:
+                pair_score = score(first, second, tolerance)
+                if pair_score < threshold:
+                    continue
+
+                first_root = _find(parents, first)
+                second_root = _find(parents, second)
+                group_score = min(pair_score,
+                                  scores.pop(first_root, 1.0),
+                                  scores.pop(second_root, 1.0))
+                if first_root is not second_root:
+                    parents[second_root] = first_root
+                scores[first_root] = group_score
+
+    groups = defaultdict(list)
+    for candidate in candidates:
+        groups[_find(parents, candidate)].append(candidate.track)
+
+    return [(scores[root], group) for root, group in groups.iteritems()
+            if len(group) > 1]
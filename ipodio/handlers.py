@@ -3,11 +3,21 @@
 import os
 import re
 import sys
+import time
 import shutil
 
-from .track import Track
+from .hashing import Hasher, DEFAULT_ALGORITHM, DEFAULT_MAXBYTES
+from .cache import HashCache, CachedHasher
 from .console import Console
+from .fuzzy import find_similar
+from .workers import imap, RateLimiter
+from .copier import free_space
+from .sorting import parse_order, sorted_tracks
 from .database import Database, Playlist
+from .itunesdb import ITunesDB, ITunesDBError
+from .journal import Journal
+from .discovery import find_files
+from .pusher import Pusher, PRIORITIES, total_size
 
 
 def first(collection):
@@ -20,17 +30,11 @@ def error(message):
     sys.exit(1)
 
 
-def _sorted_tracks(tracks, key=None):
-    def by(field):
-        def accessor(element):
-            return (key(element) if key else element).internal[field]
-        return accessor
-
-    tracks.sort(key=by('track_nr'))
-    tracks.sort(key=by('album'))
-    tracks.sort(key=by('artist'))
-
-    return tracks
+def _parse_order(sort):
+    try:
+        return parse_order(sort)
+    except ValueError as invalid:
+        error(unicode(invalid))
 
 
 class Namespace(object):
@@ -62,6 +66,125 @@ def _internal_line(track):
         title=track.title, album=track.album, artist=track.artist)
 
 
+def _parse_jobs(jobs, name='jobs'):
+    try:
+        number = int(jobs or 1)
+    except (ValueError, TypeError):
+        number = 0
+
+    if number < 1:
+        error('Invalid number of {} "{}"'.format(name, jobs))
+
+    return number
+
+
+def _parse_hasher(hash_algorithm, hash_bytes):
+    if hash_algorithm is None and hash_bytes is None:
+        return None
+
+    try:
+        maxbytes = DEFAULT_MAXBYTES if hash_bytes is None else int(hash_bytes)
+        return Hasher(hash_algorithm or DEFAULT_ALGORITHM, maxbytes or None)
+    except ValueError as invalid:
+        error('Invalid hashing options: {}'.format(invalid))
+
+
+class Session(object):
+    """A database shared by several commands, which is only saved on demand"""
+
+    def __init__(self, mount, jobs=None, hash_algorithm=None, hash_bytes=None,
+                 read_only=False):
+        self.mount = mount
+        self.jobs = jobs
+        self.hasher = _parse_hasher(hash_algorithm, hash_bytes)
+        self.read_only = read_only
+        self.database = None
+        self.indexed = False
+        self.pending = False  # Whether any command asked to save
+
+    def open(self, index=False):
+        if self.database is None:
+            self.database = _create_database(self.mount, self.hasher,
+                                             self.read_only)
+
+        if index and not self.indexed:
+            self.database.update_index(jobs=_parse_jobs(self.jobs))
+            self.indexed = True
+
+        return self.database
+
+    def save(self):
+        if self.database is None:
+            return
+
+        if self.pending or self.database.updated:
+            self.database.save()
+            self.database.updated = self.pending = False
+
+
+_session = None  # The session the commands run within, if any
+
+
+def start_session(mount, jobs=None, hash_algorithm=None, hash_bytes=None,
+                  read_only=False):
+    """Make every command use the same database until end_session"""
+    global _session
+    _session = Session(mount, jobs, hash_algorithm, hash_bytes, read_only)
+    return _session
+
+
+def end_session(save=True):
+    global _session
+    session, _session = _session, None
+    if save and session is not None:
+        session.save()
+
+
+def _create_database(mount, hasher=None, read_only=False):
+    """Open the database through libgpod, or through the iTunesDB reader
+    for commands which do not modify it and as long as it can read it"""
+    if read_only:
+        try:
+            return Database.create(mount, internal_class=ITunesDB,
+                                   hasher=hasher)
+        except ITunesDBError:
+            pass
+
+    try:
+        return Database.create(mount, hasher=hasher)
+    except ImportError as missing:
+        error(unicode(missing))
+
+
+def _save(database):
+    """Save the database, or leave it to the session sharing it"""
+    if _session is None:
+        database.save()
+    else:
+        _session.pending = True
+
+
+def _open_database(mount, hasher=None, read_only=False):
+    if _session is not None:
+        return _session.open()
+
+    return _create_database(mount, hasher, read_only)
+
+
+def _open_indexed_database(mount, jobs, hash_algorithm, hash_bytes,
+                           read_only=False):
+    """Open and index the database, hashing the tracks which lack a hash
+    with the given hasher if any"""
+    if _session is not None:
+        return _session.open(index=True)
+
+    database = _open_database(mount, _parse_hasher(hash_algorithm, hash_bytes),
+                              read_only)
+    database.update_index(jobs=_parse_jobs(jobs))
+
+    return database
+
+
 def _compile_regular_expression(expression):
     try:
         return re.compile(expression, flags=re.IGNORECASE)
@@ -73,93 +196,335 @@ def _filter_by_regular_expression(regexp, tracks):
     return [track for track in tracks if regexp.search(_internal_line(track))]
 
 
-def list(mount, expression=None):
-    """List ipod contents"""
-    database = Database.create(mount)
-    database.update_index()
+def _selected_fields(artist, album, title, genre):
+    fields = dict(artist=artist, album=album, title=title, genre=genre)
+    return {field: value for field, value in fields.items()
+            if value is not None}
 
-    tracks = database.tracks
-    if expression is not None:
+
+def _select_tracks(database, expression, artist=None, album=None, title=None,
+                   genre=None, required=False):
+    """Find the tracks by their fields through the database indexes and then
+    filter them by the regular expression, if any
+
+    When `required`, refuse to select every track if neither fields nor an
+    expression are given.
+    """
+    fields = _selected_fields(artist, album, title, genre)
+    if required and not fields and not expression:
+        error('Select the tracks with an expression or any of --artist, '
+              '--album, --title or --genre')
+
+    tracks = database.find_by_fields(**fields)
+
+    if expression:
         regexp = _compile_regular_expression(' '.join(expression))
         tracks = _filter_by_regular_expression(regexp, tracks)
 
+    return tracks
+
+
+def list(mount, expression=None, jobs=None, hash_algorithm=None,
+         hash_bytes=None, artist=None, album=None, title=None, genre=None,
+         sort=None):
+    """List ipod contents"""
+    order = _parse_order(sort)
+    database = _open_indexed_database(mount, jobs, hash_algorithm, hash_bytes,
+                                      read_only=True)
+
+    tracks = _select_tracks(database, expression, artist, album, title, genre)
+
     if tracks:
         print(_header())
         print(_separator('-'))
 
-    for track in _sorted_tracks(tracks):
+    for track in sorted_tracks(tracks, order):
         print(_line(track))
 
     if database.updated:
-        database.save()
+        _save(database)
 
 
-def duplicates(mount, expression):
+def duplicates(mount, expression, jobs, hash_algorithm, hash_bytes, fuzzy,
+               sort=None):
     """List ipod contents grouping duplicated tracks"""
-    database = Database.create(mount)
-    database.update_index()
+    order = _parse_order(sort)
+    database = _open_database(
+        mount, _parse_hasher(hash_algorithm, hash_bytes), read_only=True)
+
+    if fuzzy:
+        scored_groups = find_similar(database.tracks)
+    else:
+        scored_groups = [(None, group) for group in
+                         database.find_duplicates(jobs=_parse_jobs(jobs))]
 
     regexp = _compile_regular_expression(' '.join(expression))
-    track_groups = _sorted_tracks(database.duplicates, key=lambda g: first(g))
+    scored_groups = sorted_tracks(
+        scored_groups, order, key=lambda scored_group: first(scored_group[1]))
 
-    if track_groups:
+    if scored_groups:
         print(_header())
         print(_separator('-'))
 
-    for group in track_groups:
+    for score, group in scored_groups:
         if any(_filter_by_regular_expression(regexp, group)):
+            if score is not None:
+                print('Similarity: {:.0%}'.format(score))
             for track in group:
                 print(_line(track))
 
     if database.updated:
-        database.save()
+        _save(database)
 
 
-def _find_files(filenames, recursive):
-    paths = map(os.path.abspath, filter(os.path.isfile, filenames))
-    directories = map(os.path.abspath, filter(os.path.isdir, filenames))
+def _parse_rate(rate):
+    """Parse a number of bytes per second with an optional K, M or G suffix"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
 
-    if recursive:
-        paths.extend(os.path.join(root, file)
-                     for directory in directories
-                     for root, subdirs, files in os.walk(directory)
-                     for file in files)
-    else:
-        paths.extend(os.path.join(directory, contained_file)
-                     for directory in directories
-                     for contained_file in os.listdir(directory))
+    try:
+        text = rate.strip().upper()
+        unit = units.get(text[-1:], 1)
+        number = float(text[:-1] if text[-1:] in units else text) * unit
+    except (ValueError, AttributeError):
+        number = 0
 
-    return paths
+    if number <= 0:
+        error('Invalid rate "{}"'.format(rate))
 
+    return number
 
-def push(mount, filename, force, recursive):
-    """Push music files into the ipod"""
-    database = Database.create(mount)
-    database.update_index()
 
-    for path in _find_files(filename, recursive):
+def _verify_track(track, stored_hash, hash_name, limiter):
+    """Hash the track file again, returning its status and the bytes read"""
+    filename = track.filename
+    if not stored_hash:
+        return 'unhashed', 0
+
+    try:
+        hasher = Hasher.from_name(hash_name)
+        size = os.path.getsize(filename)
+    except ValueError:
+        return 'unknown', 0
+    except OSError:
+        return 'missing', 0
+
+    read = min(size, hasher.maxbytes or size)
+    if limiter:
+        limiter.acquire(read)
+
+    try:
+        hash = hasher.hash(filename)
+    except (IOError, OSError):
+        return 'missing', 0
+
+    return ('ok' if hash == stored_hash else 'mismatch'), read
+
+
+def verify(mount, expression, jobs, rate_limit):
+    """Check the track files still match their stored hashes"""
+    jobs = _parse_jobs(jobs)
+    limiter = RateLimiter(_parse_rate(rate_limit)) if rate_limit else None
+
+    database = _open_database(mount, read_only=True)
+
+    tracks = database.tracks
+    if expression:
+        regexp = _compile_regular_expression(' '.join(expression))
+        tracks = _filter_by_regular_expression(regexp, tracks)
+
+    messages = {
+        'mismatch': 'Hash mismatch: {}',
+        'missing': 'Missing file: {}',
+        'unknown': 'Unknown hasher: {}',
+        'unhashed': 'Not hashed: {}',
+    }
+    counts = dict.fromkeys(
+        ['ok', 'mismatch', 'missing', 'unknown', 'unhashed'], 0)
+    total_bytes = 0
+    started = time.time()
+
+    # Hashes made by read-only commands are only kept in the sidecar file
+    stored = [(track,) + database.stored_hash(track) for track in tracks]
+
+    def check(item):
+        track, hash, hash_name = item
+        return (track,) + _verify_track(track, hash, hash_name, limiter)
+
+    for track, status, read in imap(check, stored, jobs):
+        counts[status] += 1
+        total_bytes += read
+        if status != 'ok':
+            print(messages[status].format(track))
+
+    elapsed = max(time.time() - started, 1e-6)
+    print('Verified {} tracks: {ok} ok, {mismatch} mismatched, '
+          '{missing} missing, {unhashed} not hashed, '
+          '{unknown} unknown hashers'.format(len(tracks), **counts))
+    print('Read {:.1f} MB in {:.1f}s: {:.1f} MB/s, {:.1f} tracks/s'.format(
+        total_bytes / 1e6, elapsed, total_bytes / 1e6 / elapsed,
+        len(tracks) / elapsed))
+
+
+def _make_cached_hasher(hasher, no_hash_cache, cache=None):
+    if no_hash_cache:
+        return hasher, None
+
+    cache = cache or HashCache.create()
+    return CachedHasher(hasher, cache), cache
+
+
+def _save_hash_cache(cache):
+    """Save the cache, which is not worth failing the command for"""
+    try:
+        cache.save()
+    except (OSError, IOError, ValueError) as failure:
+        print('Could not save hash cache "{}": {}'.format(cache.path, failure))
+
+
+def _other_hashers(database):
+    """Hashers for the tracks in the database not hashed by its own hasher"""
+    names = database.hash_names - set([None, database.hasher.name])
+
+    hashers = []
+    for name in names:
         try:
-            track = Track.create(path)
-            track.update_hash()
-        except Exception as error:
-            print('Could not read track "{}": {}'.format(path, error))
-            continue
-
-        if not force and database.get(track):
-            print('Not sending: "{}" which is already in the ipod.'
-                  .format(track))
-        else:
-            database.add(track)
+            hashers.append(Hasher.from_name(name))
+        except ValueError:
+            print('Ignoring tracks hashed by unknown hasher "{}"'.format(name))
+
+    return hashers
+
+
+def _print_copy_rate(copier):
+    if copier is not None and copier.files:
+        print('Sent {} files, {:.1f} MB in {:.1f}s: {:.1f} MB/s'.format(
+            copier.files, copier.bytes / 1048576.0, copier.seconds,
+            copier.rate / 1048576.0))
+
+
+def _parse_checkpoint(checkpoint):
+    if checkpoint is None:
+        return 0
+
+    try:
+        number = int(checkpoint)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        error('Invalid number of tracks between checkpoints "{}"'.format(
+            checkpoint))
+
+    return number
 
-    if database.updated:
-        def progress(database, track, n, total):
-            print('Sending {}/{}: {}'.format(n, total, Track(track)))
 
-        database.copy_files(progress)
+def _checkpoint(database):
+    """Save the database right away, even within a session"""
+    if _session is None:
         database.save()
+    else:
+        _session.pending = True
+        _session.save()
+
+
+def _open_journal(mount, resume, plan=False):
+    """Start the journal of the push, returning the entries to resume"""
+    journal = Journal.create(mount)
+    saved, unsaved = journal.load()
+
+    if plan:  # Left as it is
+        return (journal, saved, unsaved) if resume else (journal, {}, {})
+
+    if not resume:
+        if unsaved:
+            print('Removing {} files copied by an interrupted push, '
+                  'use --resume to keep them'.format(len(unsaved)))
+            for entry in unsaved.itervalues():
+                try:
+                    os.remove(journal.ipod_filename(entry))
+                except OSError:
+                    pass
+        saved, unsaved = {}, {}
+
+    try:
+        journal.start(resume)
+    except (OSError, IOError) as failure:
+        error('Cannot write the journal "{}": {}'.format(
+            journal.path, failure))
+
+    return journal, saved, unsaved
+
+
+def _parse_priority(priority):
+    if priority is None:
+        return PRIORITIES['order']
+
+    if priority not in PRIORITIES:
+        error('Invalid priority "{}", use any of: {}'.format(
+            priority, ', '.join(sorted(PRIORITIES))))
+
+    return PRIORITIES[priority]
+
+
+def push(mount, filename, force, recursive, no_hash_cache, jobs,
+         hash_algorithm, hash_bytes, writers=None, resume=False,
+         checkpoint=None, exclude=(), fit=False, priority=None, plan=False):
+    """Push music files into the ipod"""
+    jobs = _parse_jobs(jobs)
+    writers = _parse_jobs(writers, 'writers')
+    checkpoint = _parse_checkpoint(checkpoint)
+    priority = _parse_priority(priority)
+    database = _open_indexed_database(mount, jobs, hash_algorithm, hash_bytes,
+                                      read_only=plan)
+
+    hasher, cache = _make_cached_hasher(database.hasher, no_hash_cache)
+    # Tracks hashed by other hashers are compared using their own hasher
+    other_hashers = [_make_cached_hasher(other, no_hash_cache, cache)[0]
+                     for other in _other_hashers(database)]
+
+    # Files copied by an interrupted push are not read or copied again
+    journal, saved, unsaved = _open_journal(mount, resume, plan)
+    pusher = Pusher(database, journal, saved, unsaved, hasher=hasher,
+                    other_hashers=other_hashers, force=force, jobs=jobs,
+                    writers=writers)
+
+    # Every file is found first, so a stat tells whether they fit. When they
+    # do, they are read ahead of the copies. Otherwise every file is read
+    # first, so nothing is copied unless the new tracks fit.
+    with pusher.stopwatch.measure('discovery'):
+        paths = [path for path in find_files(filename, recursive,
+                                             exclude or ())]
+    results = reading = pusher.read(paths)
+
+    free = free_space(mount)
+    try:
+        if plan:
+            return pusher.plan(results, free, fit, priority)
+
+        if free is not None and total_size(paths) > free:
+            try:
+                results = pusher.fit(results, free, fit, priority)
+            except ValueError as full:
+                error(unicode(full))
+
+        try:
+            # Saved right away, even within a batch, as the journal is removed
+            sent = pusher.push(results, checkpoint, _checkpoint)
+        except (OSError, IOError) as failure:
+            error('Could not write the files into the iPod: {}'.format(
+                failure))
+    finally:
+        reading.close()  # Stop reading before the cache is saved
+        if cache is not None:
+            _save_hash_cache(cache)
+
+    if sent:
+        _print_copy_rate(database.copier)
     else:
         print('No files sent.')
 
+    journal.remove()
+
 
 def _make_destination_directory(dest):
     destination = os.path.realpath(dest or '.')
@@ -214,12 +579,11 @@ def _copy_track_from_ipod(track_destination, track, force):
             track.filename_from_tags, os.path.dirname(track_destination))
 
 
-def pull(mount, expression, dest, force, plain):
+def pull(mount, expression, dest, force, plain, artist, album, title, genre):
     """List ipod contents grouping duplicated tracks"""
-    database = Database.create(mount)
+    database = _open_database(mount, read_only=True)
 
-    regexp = _compile_regular_expression(' '.join(expression))
-    tracks = _filter_by_regular_expression(regexp, database.tracks)
+    tracks = _select_tracks(database, expression, artist, album, title, genre)
 
     destination = _make_destination_directory(dest)
     if not destination:
@@ -231,12 +595,12 @@ def pull(mount, expression, dest, force, plain):
             _copy_track_from_ipod(track_destination, track, force)
 
 
-def rm(mount, expression, yes):
-    database = Database.create(mount)
-    database.update_index()
+def rm(mount, expression, yes, jobs, hash_algorithm, hash_bytes,
+       artist, album, title, genre):
+    database = _open_indexed_database(mount, jobs, hash_algorithm, hash_bytes)
 
-    regexp = _compile_regular_expression(' '.join(expression))
-    tracks = _filter_by_regular_expression(regexp, database.tracks)
+    tracks = _select_tracks(database, expression, artist, album, title, genre,
+                            required=True)
 
     if not tracks:
         print('No tracks removed.')
@@ -250,12 +614,12 @@ def rm(mount, expression, yes):
         database.remove(track)
 
     if database.updated and (yes or raw_input('Remove? [y/n]: ') == 'y'):
-        database.save()
+        _save(database)
 
 
-def rename(mount, expression, replacement, yes):
-    database = Database.create(mount)
-    database.update_index()
+def rename(mount, expression, replacement, yes, jobs, hash_algorithm,
+           hash_bytes):
+    database = _open_indexed_database(mount, jobs, hash_algorithm, hash_bytes)
 
     regexp = re.compile(' '.join(expression))
     tracks = [track for track in database.tracks if regexp.search(_line(track))]
@@ -264,26 +628,24 @@ def rename(mount, expression, replacement, yes):
         track.internal['artist'] = regexp.sub(replacement, track.internal['artist'])
         track.internal['album'] = regexp.sub(replacement, track.internal['album'])
         track.internal['title'] = regexp.sub(replacement, track.internal['title'])
+        database.refresh(track)
 
         print(_line(track))
 
     if tracks and (yes or raw_input('Rename? [y/n]: ') == 'y'):
-        database.save()
-
+        _save(database)
 
-def _find_playlist_named(name, playlists):
-    return first(p for p in playlists if p.name == name)
 
-
-def playlist(mount, name, expression):
-    database = Database.create(mount)
+def playlist(mount, name, expression, sort=None):
+    order = _parse_order(sort) if sort else None
+    database = _open_database(mount, read_only=True)
 
     if name is None:
         for playlist in database.playlists:
             print(playlist.name)
         return
 
-    playlist = _find_playlist_named(name, database.playlists)
+    playlist = database.get_playlist(name)
     if not playlist:
         print('The playlist "{}" does not exist'.format(name))
         return
@@ -293,6 +655,9 @@ def playlist(mount, name, expression):
         regexp = _compile_regular_expression(' '.join(expression))
         tracks = _filter_by_regular_expression(regexp, tracks)
 
+    if order:  # Otherwise in the order of the playlist
+        tracks = sorted_tracks(tracks, order)
+
     if tracks:
         print('Playlist: ' + name)
         print(_header())
@@ -303,29 +668,30 @@ def playlist(mount, name, expression):
 
 
 def playlist_create(mount, name):
-    database = Database.create(mount)
+    database = _open_database(mount)
 
-    if _find_playlist_named(name, database.playlists):
+    if database.get_playlist(name):
         print('A playlist named "{}" already exists'.format(name))
         return
 
     Playlist.create(name, database)
-    database.save()
+    _save(database)
     print('Created playlist: "{}"'.format(name))
 
 
-def playlist_add(mount, name, expression, yes, force):
-    database = Database.create(mount)
+def playlist_add(mount, name, expression, yes, force, artist, album, title,
+                 genre):
+    database = _open_database(mount)
 
-    playlist = _find_playlist_named(name, database.playlists)
+    playlist = database.get_playlist(name)
     if not playlist:
         print('The playlist "{}" does not exist'.format(name))
         return
 
-    tracks = database.tracks
-    if expression is not None:
-        regexp = _compile_regular_expression(' '.join(expression))
-        tracks = _filter_by_regular_expression(regexp, tracks)
+    tracks = [track for track in
+              _select_tracks(database, expression, artist, album, title, genre,
+                             required=True)
+              if track not in playlist]
 
     if not tracks:
         print('No tracks to add')
@@ -340,13 +706,13 @@ def playlist_add(mount, name, expression, yes, force):
 
     if tracks and (yes or raw_input('Add tracks to playlist? [y/n]: ') == 'y'):
         playlist.extend(tracks)
-        database.save()
+        _save(database)
 
 
 def playlist_rm(mount, name, expression, yes):
-    database = Database.create(mount)
+    database = _open_database(mount)
 
-    playlist = _find_playlist_named(name, database.playlists)
+    playlist = database.get_playlist(name)
     if not playlist:
         print('The playlist "{}" does not exist'.format(name))
         return
@@ -358,7 +724,7 @@ def playlist_rm(mount, name, expression, yes):
     if not expression:
         if (yes or raw_input('Totally remove "{}"? [y/n]: '.format(name)) == 'y'):
             database.remove_playlist(playlist)
-            database.save()
+            _save(database)
             return
     else:
         regexp = _compile_regular_expression(' '.join(expression))
@@ -374,21 +740,21 @@ def playlist_rm(mount, name, expression, yes):
 
             if (yes or raw_input('Detach songs from playlist? [y/n]: ') == 'y'):
                 playlist.discard(tracks)
-                database.save()
+                _save(database)
 
 
 def playlist_rename(mount, name, new_name):
-    database = Database.create(mount)
+    database = _open_database(mount)
 
-    playlist = _find_playlist_named(name, database.playlists)
+    playlist = database.get_playlist(name)
     if not playlist:
         print('The playlist "{}" does not exist'.format(name))
         return
 
-    if _find_playlist_named(new_name, database.playlists):
+    if database.get_playlist(new_name):
         print('The playlist "{}" already exists')
         return
 
     print('Playlist "{}" renamed to "{}"')
-    playlist.name = new_name
-    database.save()
+    database.rename_playlist(playlist, new_name)
+    _save(database)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Hashing
+
+Hashes the audio contents of the song files, ignoring their tags, with a
+selectable digest algorithm so hashing CPU can be traded for throughput.
+
+Each Hasher has a name which identifies both the algorithm and the amount of
+audio being hashed, as digests are only comparable when both match. Tracks
+store it next to their digest so libraries hashed with different settings can
+still be indexed.
+
+    # The default settings, as used by every ipodio version before
+    hasher = Hasher()                       # hasher.name == 'sha1:524288'
+
+    # Faster, non cryptographic checksum over the whole audio
+    hasher = Hasher('crc32', maxbytes=None) # hasher.name == 'crc32:all'
+
+    # The same hasher a digest was obtained with
+    hasher = Hasher.from_name('crc32:all')
+
+    hasher.hash('/path/to/song')
+
+New algorithms can be made available with `register_algorithm`, given any
+factory of objects providing the `update` and `hexdigest` methods.
+
+The audio is located skipping the ID3v2 tag at the start of the file and the
+ID3v1 (and extended ID3v1) and APEv2 tags at its end. Files are memory mapped
+and the audio region is fed to the digest without copying it, falling back to
+reading it in blocks when the file cannot be mapped.
+"""
+
+import io
+import os
+import zlib
+import struct
+import hashlib
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+try:
+    _view = buffer  # Python 2 hashlib and zlib only take old style buffers
+except NameError:
+    def _view(data, offset, size):
+        return memoryview(data)[offset:offset + size]
+
+
+DEFAULT_ALGORITHM = 'sha1'
+DEFAULT_MAXBYTES = 512 * 1024
+
+
+class Checksum(object):
+    """hashlib-like interface for the zlib checksum functions"""
+
+    def __init__(self, function):
+        self.function = function
+        self.value = function(b'')
+
+    def update(self, data):
+        self.value = self.function(data, self.value)
+
+    def hexdigest(self):
+        return '{:08x}'.format(self.value & 0xffffffff)
+
+
+ALGORITHMS = {
+    'sha1': hashlib.sha1,
+    'md5': hashlib.md5,
+    'crc32': lambda: Checksum(zlib.crc32),
+    'adler32': lambda: Checksum(zlib.adler32),
+}
+
+if hasattr(hashlib, 'blake2b'):
+    ALGORITHMS['blake2b'] = hashlib.blake2b
+
+
+def register_algorithm(name, factory):
+    ALGORITHMS[name] = factory
+
+
+def hasher_name(algorithm, maxbytes):
+    return u'{}:{}'.format(algorithm, maxbytes or 'all')
+
+
+# Digests stored before hashers were named were all made with the defaults
+DEFAULT_NAME = hasher_name(DEFAULT_ALGORITHM, DEFAULT_MAXBYTES)
+
+
+class Hasher(object):
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, maxbytes=DEFAULT_MAXBYTES):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(u'Unknown hash algorithm "{}"'.format(algorithm))
+
+        if maxbytes is not None and maxbytes <= 0:
+            raise ValueError(u'maxbytes must be a positive integer')
+
+        self.algorithm = algorithm
+        self.maxbytes = maxbytes
+
+    @classmethod
+    def from_name(cls, name):
+        algorithm, _, maxbytes = name.partition(u':')
+
+        try:
+            maxbytes = None if maxbytes == u'all' else int(maxbytes)
+        except ValueError:
+            raise ValueError(u'Invalid hasher name "{}"'.format(name))
+
+        return cls(algorithm, maxbytes)
+
+    @property
+    def name(self):
+        return hasher_name(self.algorithm, self.maxbytes)
+
+    def hash(self, filename):
+        return hash_audio(filename, ALGORITHMS[self.algorithm](),
+                          self.maxbytes)
+
+
+ID3V1_SIZE = 128
+ID3V1_EXTENDED_SIZE = 227
+ID3V2_HEADER_SIZE = 10
+ID3V2_FOOTER_SIZE = 10
+APE_FOOTER_SIZE = 32
+APE_HAS_HEADER = 1 << 31
+
+
+def _syncsafe_integer(data):
+    """ID3v2 sizes use 7 bits of each byte, big endian"""
+    value = 0
+    for byte in bytearray(data):
+        value = (value << 7) | (byte & 0x7f)
+    return value
+
+
+def audio_limits(read, size):
+    """Return the (start, end) bytes of the audio within a file of given size
+
+    `read(offset, length)` must return the file bytes at that offset.
+    """
+    start, end = 0, size
+
+    if size >= ID3V2_HEADER_SIZE:
+        header = read(0, ID3V2_HEADER_SIZE)
+        if header[:3] == b'ID3':
+            version, _, flags = bytearray(header[3:6])
+            start = ID3V2_HEADER_SIZE + _syncsafe_integer(header[6:10])
+            if version == 4 and flags & 0x10:
+                start += ID3V2_FOOTER_SIZE
+            start = min(start, size)
+
+    if end - start >= ID3V1_SIZE and read(end - ID3V1_SIZE, 3) == b'TAG':
+        end -= ID3V1_SIZE
+        if (end - start >= ID3V1_EXTENDED_SIZE
+                and read(end - ID3V1_EXTENDED_SIZE, 4) == b'TAG+'):
+            end -= ID3V1_EXTENDED_SIZE
+
+    if end - start >= APE_FOOTER_SIZE:
+        footer = read(end - APE_FOOTER_SIZE, APE_FOOTER_SIZE)
+        if footer[:8] == b'APETAGEX':
+            tag_size, flags = struct.unpack('<4xI4xI', footer[8:24])
+            if flags & APE_HAS_HEADER:
+                tag_size += APE_FOOTER_SIZE
+            end = max(start, end - tag_size)
+
+    return start, end
+
+
+def _map(song, size):
+    if mmap is None or not size:
+        return None
+
+    try:
+        return mmap.mmap(song.fileno(), 0, access=mmap.ACCESS_READ)
+    except EnvironmentError:
+        return None
+
+
+def _hash_mapped(mapping, size, digest, maxbytes):
+    try:
+        start, end = audio_limits(
+            lambda offset, length: mapping[offset:offset + length], size)
+        if maxbytes is not None:
+            end = min(end, start + maxbytes)
+
+        if hasattr(mapping, 'madvise'):
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+
+        digest.update(_view(mapping, start, end - start))
+    finally:
+        mapping.close()
+
+
+def _hash_buffered(song, size, digest, maxbytes, blocksize=512 * 1024):
+    def read(offset, length):
+        song.seek(offset)
+        return song.read(length)
+
+    start, end = audio_limits(read, size)
+    if maxbytes is not None:
+        end = min(end, start + maxbytes)
+
+    block = bytearray(blocksize)
+    song.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        count = song.readinto(memoryview(block)[:min(blocksize, remaining)])
+        if not count:
+            break
+        digest.update(_view(block, 0, count))
+        remaining -= count
+
+
+def hash_audio(filename, digest, maxbytes=None):
+    """Feed the audio of the file to the digest and return its hexdigest"""
+    with io.open(filename, 'rb') as song:
+        size = os.fstat(song.fileno()).st_size
+
+        mapping = _map(song, size)
+        if mapping is not None:
+            _hash_mapped(mapping, size, digest, maxbytes)
+        else:
+            _hash_buffered(song, size, digest, maxbytes)
+
+    return digest.hexdigest()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+iTunesDB
+
+Read-only access to the tracks and playlists of the iPod straight from its
+iTunesDB file, without libgpod. It provides the small part of the gpod
+interface ipodio uses, so it can be given to Database.create:
+
+    database = Database.create('/ipod/mountpoint', internal_class=ITunesDB)
+
+The file is memory mapped and walked once to find where each track and
+playlist starts. Tracks are only represented by that offset, and their fields
+are read from the mapping and their strings decoded when they are requested,
+so memory use grows with the tracks which are actually used and not with the
+size of the library.
+
+Userdata stored by python-gpod in the iTunesDB.ext file, such as the track
+hashes, is loaded the first time a track's userdata is requested. Any attempt
+to modify the database raises ITunesDBError, as does any file which cannot be
+read, so callers can fall back to libgpod.
+"""
+
+import io
+import os
+import struct
+import hashlib
+from array import array
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+from .sidecar import ITUNES_DIRECTORY
+
+
+class ITunesDBError(Exception):
+    pass
+
+
+TRACKS_DATASET = 1
+PLAYLISTS_DATASET = 2
+
+# Fields of the mhit header as {name: (offset, struct format)}
+TRACK_FIELDS = {
+    'id': (16, '<I'),
+    'size': (36, '<I'),
+    'tracklen': (40, '<I'),
+    'track_nr': (44, '<I'),
+    'tracks': (48, '<I'),
+    'year': (52, '<I'),
+    'bitrate': (56, '<I'),
+    'rating': (31, '<B'),
+    'playcount': (80, '<I'),
+    'cd_nr': (92, '<I'),
+    'cds': (96, '<I'),
+    'dbid': (112, '<Q'),
+}
+
+# String mhod types as {type: name}
+TRACK_STRINGS = {
+    1: 'title',
+    2: 'ipod_path',
+    3: 'album',
+    4: 'artist',
+    5: 'genre',
+    6: 'filetype',
+    8: 'comment',
+    12: 'composer',
+    13: 'grouping',
+}
+
+STRING_TYPES = {name: type for type, name in TRACK_STRINGS.items()}
+
+STRING_UTF8 = 2
+PLAYLIST_TITLE = 1
+
+
+def _unpack(data, offset, format):
+    try:
+        return struct.unpack_from(format, data, offset)
+    except struct.error:
+        raise ITunesDBError(u'Truncated record at {}'.format(offset))
+
+
+def _record(data, offset, magic):
+    """Return the header and total length of the record at offset"""
+    found, header_length, total_length = _unpack(data, offset, '<4sII')
+    if found != magic:
+        raise ITunesDBError(u'Expected {} at {}, found {!r}'.format(
+            magic, offset, found))
+    return header_length, total_length
+
+
+def _find_string(data, offset, count, type):
+    """Decode the string of the given type among the mhods at offset"""
+    for _ in range(count):
+        header_length, total_length = _record(data, offset, b'mhod')
+        if _unpack(data, offset + 12, '<I')[0] == type:
+            return _decode_string(data, offset)
+        offset += total_length
+
+
+def _skip(data, offset, count, magic):
+    """Return the offset after the count records at offset"""
+    for _ in range(count):
+        offset += _record(data, offset, magic)[1]
+    return offset
+
+
+def _decode_string(data, offset):
+    encoding, length = _unpack(data, offset + 24, '<II')
+    raw = data[offset + 40:offset + 40 + length]
+    return raw.decode('utf-8' if encoding == STRING_UTF8 else 'utf-16-le')
+
+
+def _read_only(*args, **kwargs):
+    raise ITunesDBError(u'The iTunesDB reader cannot modify the database')
+
+
+class ITunesTrack(object):
+    """A track of the iTunesDB, read from the mhit record at offset"""
+    __slots__ = ('__database', '__offset', '__userdata')
+
+    def __init__(self, database, offset):
+        self.__database = database
+        self.__offset = offset
+        self.__userdata = None
+
+    def __getitem__(self, name):
+        data, offset = self.__database.data, self.__offset
+
+        if name == 'userdata':
+            if self.__userdata is None:
+                self.__userdata = dict(
+                    self.__database.userdata.get(self['id'], {}))
+            return self.__userdata
+
+        if name in TRACK_FIELDS:
+            position, format = TRACK_FIELDS[name]
+            header_length, = _unpack(data, offset + 4, '<I')
+            if position + struct.calcsize(format) > header_length:
+                return None
+            return _unpack(data, offset + position, format)[0]
+
+        if name in STRING_TYPES:
+            header_length, _, mhods = _unpack(data, offset + 4, '<III')
+            return _find_string(data, offset + header_length, mhods,
+                                STRING_TYPES[name])
+
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        if name != 'userdata':
+            _read_only()
+        self.__userdata = value
+
+    def ipod_filename(self):
+        path = self['ipod_path']
+        if not path:
+            return None
+        return os.path.join(self.__database.mountpoint,
+                            *path.lstrip(u':').split(u':'))
+
+
+class ITunesPlaylist(object):
+    def __init__(self, database, name, master, track_ids):
+        self.__database = database
+        self.__name = name
+        self.__master = master
+        self.__track_ids = track_ids
+
+    def get_name(self):
+        return self.__name
+
+    def get_master(self):
+        return self.__master
+
+    def __iter__(self):
+        return self.__database.tracks_by_id(self.__track_ids)
+
+    def __len__(self):
+        return len(self.__track_ids)
+
+    set_name = add = remove = _read_only
+
+
+def _parse_userdata(path, itunesdb_hash):
+    """Read python-gpod's iTunesDB.ext, as {track id: {key: value}}
+
+    `itunesdb_hash()` must return the hash of the iTunesDB as python-gpod
+    computes it, which is only called when the file has one to compare with.
+    """
+    userdata, block = {}, None
+    try:
+        with io.open(path, 'rb') as ext_file:
+            lines = ext_file.read().decode('utf-8', 'replace').splitlines()
+    except (IOError, OSError):
+        return userdata
+
+    for line in lines:
+        key, separator, value = line.partition(u'=')
+        if not separator:
+            continue
+        if key == u'itunesdb_hash':
+            if value != itunesdb_hash():
+                return {}  # Written for another iTunesDB
+        elif key == u'id':
+            try:
+                block = userdata.setdefault(int(value), {})
+            except ValueError:
+                block = None
+        elif key != u'version' and block is not None:
+            block[key.encode('utf-8')] = value
+
+    return userdata
+
+
+EXT_HASHED_BYTES = 16384
+
+
+def _ext_hash(data):
+    """The hash of the iTunesDB python-gpod writes into its .ext file
+
+    As gtkpod.sha1_hash, the sha1 of the file size followed by its first
+    16 KiB.
+    """
+    digest = hashlib.sha1(struct.pack('<L', len(data)))
+    digest.update(data[:EXT_HASHED_BYTES])
+    return digest.hexdigest()
+
+
+def _map(path):
+    """Memory map the file, or read it when it cannot be mapped"""
+    with io.open(path, 'rb') as itunesdb:
+        if mmap is not None:
+            try:
+                return mmap.mmap(itunesdb.fileno(), 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                pass
+        return itunesdb.read()
+
+
+class ITunesDB(object):
+    read_only = True
+
+    def __init__(self, mountpoint):
+        self.mountpoint = mountpoint
+        self.path = os.path.join(mountpoint, ITUNES_DIRECTORY, 'iTunesDB')
+
+        try:
+            self.data = _map(self.path)
+        except (IOError, OSError) as failure:
+            raise ITunesDBError(u'Cannot read {}: {}'.format(self.path,
+                                                             failure))
+
+        self.__userdata = None
+        self.__offsets = array('L')  # Of every mhit record
+        self.__offsets_by_id = None
+        self.__playlists = []
+        self.__parse(self.data)
+
+    @property
+    def userdata(self):
+        if self.__userdata is None:
+            self.__userdata = _parse_userdata(self.path + '.ext',
+                                              lambda: _ext_hash(self.data))
+        return self.__userdata
+
+    def __parse(self, data):
+        header_length, total_length = _record(data, 0, b'mhbd')
+        datasets, = _unpack(data, 20, '<I')
+
+        offsets, offset = {}, header_length
+        for _ in range(datasets):
+            header_length, total_length = _record(data, offset, b'mhsd')
+            type, = _unpack(data, offset + 12, '<I')
+            offsets.setdefault(type, offset + header_length)
+            offset += total_length
+
+        if TRACKS_DATASET not in offsets:
+            raise ITunesDBError(u'The iTunesDB has no track list')
+
+        self.__parse_tracks(data, offsets[TRACKS_DATASET])
+        if PLAYLISTS_DATASET in offsets:
+            self.__parse_playlists(data, offsets[PLAYLISTS_DATASET])
+
+    def __parse_tracks(self, data, offset):
+        header_length, count = _record(data, offset, b'mhlt')
+        offset += header_length
+        for _ in range(count):
+            self.__offsets.append(offset)
+            offset += _record(data, offset, b'mhit')[1]
+
+    def __parse_playlists(self, data, offset):
+        header_length, count = _record(data, offset, b'mhlp')
+        offset += header_length
+        for _ in range(count):
+            header_length, total_length = _record(data, offset, b'mhyp')
+            mhods, mhips, master = _unpack(data, offset + 12, '<IIB')
+
+            name = _find_string(data, offset + header_length, mhods,
+                                PLAYLIST_TITLE) or u''
+
+            track_ids = array('L')
+            item = _skip(data, offset + header_length, mhods, b'mhod')
+            for _ in range(mhips):
+                track_ids.append(_unpack(data, item + 24, '<I')[0])
+                item += _record(data, item, b'mhip')[1]
+
+            self.__playlists.append(
+                ITunesPlaylist(self, name, bool(master), track_ids))
+            offset += total_length
+
+    def tracks_by_id(self, track_ids):
+        """Iterate the tracks with the given mhit ids, as playlists use"""
+        if self.__offsets_by_id is None:
+            self.__offsets_by_id = {ITunesTrack(self, offset)['id']: offset
+                                    for offset in self.__offsets}
+
+        for track_id in track_ids:
+            offset = self.__offsets_by_id.get(track_id)
+            if offset is not None:
+                yield ITunesTrack(self, offset)
+
+    def __iter__(self):
+        for offset in self.__offsets:
+            yield ITunesTrack(self, offset)
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    @property
+    def Playlists(self):
+        return list(self.__playlists)
+
+    @property
+    def Master(self):
+        for playlist in self.__playlists:
+            if playlist.get_master():
+                return playlist
+
+    def close(self):
+        """Nothing to write, hashes are kept in the sidecar file"""
+
+    add = remove = copy_delayed_files = _read_only
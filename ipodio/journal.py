@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Journal
+
+Records the files copied into the iPod by push in a small file next to the
+iTunesDB, so an interrupted push can be resumed without reading, hashing and
+copying again the files it already sent.
+
+Each copied file is written as a JSON line along with the modification time,
+size and hash of its source. A checkpoint line is written every time the
+database is saved, so the files copied after the last checkpoint are known
+not to be in the iTunesDB.
+
+    journal = Journal.create('/ipod/mountpoint')
+
+    # Entries of a previous push as {source: entry}
+    saved, unsaved = journal.load()
+
+    journal.start(resume=True)
+    journal.record('/music/song.mp3', hash, 'sha1',
+                   ':iPod_Control:Music:F00:ABCD.mp3')
+    journal.checkpoint()
+
+    # Forget it once the push has finished
+    journal.remove()
+"""
+
+import os
+import sys
+import json
+import threading
+
+from .sidecar import ITUNES_DIRECTORY
+
+
+def _text(path):
+    if isinstance(path, unicode):
+        return path
+    return path.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+
+
+def _source_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+
+class Journal(object):
+    def __init__(self, path, mountpoint):
+        self.path = path
+        self.mountpoint = mountpoint
+        self.__file = None
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def create(cls, mountpoint):
+        path = os.path.join(mountpoint, ITUNES_DIRECTORY, 'ipodio.journal')
+        return cls(path, mountpoint)
+
+    def ipod_filename(self, entry):
+        return os.path.join(self.mountpoint,
+                            *entry['ipod_path'].lstrip(u':').split(u':'))
+
+    def load(self):
+        """Return the entries before and after the last checkpoint"""
+        saved, unsaved = {}, {}
+        try:
+            with open(self.path) as journal_file:
+                lines = journal_file.readlines()
+        except (IOError, OSError):
+            return saved, unsaved
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                if entry.get('checkpoint'):
+                    saved.update(unsaved)
+                    unsaved = {}
+                else:
+                    unsaved[entry['source']] = entry
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue  # A line cut short by the interruption
+
+        return saved, unsaved
+
+    def find(self, entries, source):
+        """The entry for the source, unless it changed since it was copied"""
+        entry = entries.get(_text(source))
+        if entry and entry.get('signature') == _source_signature(source):
+            return entry
+
+    def start(self, resume=False):
+        """Open the journal, keeping its entries when resuming"""
+        self.__file = open(self.path, 'a' if resume else 'w')
+
+    def __write(self, entry, sync=False):
+        with self.__lock:
+            self.__file.write(json.dumps(entry) + '\n')
+            self.__file.flush()
+            if sync:
+                os.fsync(self.__file.fileno())
+
+    def record(self, source, hash, hasher, ipod_path):
+        self.__write({'source': _text(source),
+                      'signature': _source_signature(source),
+                      'hash': hash, 'hasher': hasher, 'ipod_path': ipod_path})
+
+    def checkpoint(self):
+        """Mark the files recorded so far as saved in the database"""
+        self.__write({'checkpoint': True}, sync=True)
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
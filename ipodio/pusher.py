@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Pusher
+
+Sends music files into the iPod. Files are read and hashed by `jobs` worker
+threads ahead of the caller, and the new tracks are copied into the iPod by
+`writers` threads while the next files are read. The queues between them
+are bounded, so no stage gets far ahead of the slowest one. Tracks are added
+in the order their files are given, and copied in that same order.
+
+Every copied file is recorded in the journal, so the files copied by an
+interrupted push are neither read nor copied again when resuming it.
+
+    saved, unsaved = journal.load()
+    pusher = Pusher(database, journal, saved, unsaved, jobs=4, writers=2)
+
+    # Results of the files to send, telling why not about the rest
+    paths = list(find_files(['Albums/'], recursive=True))
+    results = pusher.read(paths)
+
+    # Unless the files fit, read them all and keep the new tracks which fit
+    free = free_space(mountpoint)
+    if total_size(paths) > free:
+        results = pusher.fit(results, free, choose=True)
+
+    # Send them, saving every 100 tracks
+    pusher.push(results, checkpoint=100)
+
+    # Or tell which would be sent and how long it would take
+    pusher.plan(results, free=free, fit=True,
+                priority=PRIORITIES['newest'])
+"""
+
+import os
+import time
+
+from .track import Track
+from .workers import imap, Consumer, Stopwatch
+from .copier import measure_write_rate
+from .discovery import is_audio
+
+
+def _print(message):
+    print(message)
+
+
+def _save(database):
+    database.save()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _file_age(path):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return float('inf')
+
+
+# Orders of the tracks to push when they do not fit, as sort keys of results
+PRIORITIES = {
+    'order': None,
+    'smallest': lambda result: _file_size(result.path),
+    'newest': lambda result: _file_age(result.path),
+}
+
+
+def total_size(paths):
+    """Bytes of the files, telling whether they fit before reading them"""
+    return sum(_file_size(path) for path in paths)
+
+
+def _megabytes(size):
+    return size / 1048576.0
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def _verified_copy(journal, entry, hasher, source):
+    """Whether the file copied by an interrupted push is whole, removing it
+    otherwise so it is copied again"""
+    filename = journal.ipod_filename(entry)
+    try:
+        # The hash may only cover the start of the file
+        if (os.path.getsize(filename) == os.path.getsize(source)
+                and hasher.hash(filename) == entry['hash']):
+            return True
+    except (OSError, IOError):
+        pass
+
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+    return False
+
+
+class Result(object):
+    """A file read to be pushed, the track to send unless skipped or failed"""
+
+    def __init__(self, path, track=None, other_hashes=(), ipod_path=None,
+                 skipped=None, error=None):
+        self.path = path
+        self.track = track
+        self.other_hashes = other_hashes
+        self.ipod_path = ipod_path  # Of a copy left by an interrupted push
+        self.skipped = skipped
+        self.error = error
+
+    @property
+    def size(self):
+        """Bytes to copy into the iPod"""
+        return 0 if self.ipod_path else _file_size(self.path)
+
+
+class Pusher(object):
+    def __init__(self, database, journal, saved=None, unsaved=None,
+                 hasher=None, other_hashers=(), force=False, jobs=1,
+                 writers=1, internal_class=None, report=_print,
+                 write_rate=measure_write_rate):
+        self.database = database
+        self.journal = journal
+        self.saved = saved or {}  # Journal entries to resume
+        self.unsaved = unsaved or {}
+        self.hasher = hasher or database.hasher
+        self.other_hashers = other_hashers  # For tracks hashed by others
+        self.force = force
+        self.jobs = jobs
+        self.writers = writers
+        self.internal_class = internal_class
+        self.report = report
+        self.write_rate = write_rate
+        self.stopwatch = Stopwatch()
+
+    def __journaled(self, entries, path):
+        entry = self.journal.find(entries, path)
+        if entry and entry['hasher'] == self.database.hasher.name:
+            return entry
+
+    def _read(self, path):
+        """Parse and hash the file, unless the interrupted push sent it"""
+        entry = self.__journaled(self.saved, path)
+        if (entry and not self.force
+                and self.database.get_by_hash(entry['hash'])):
+            return Result(path,
+                          skipped='which was sent by the interrupted push')
+
+        entry = self.__journaled(self.unsaved, path)
+        try:
+            if not is_audio(path):  # Cheaper than failing to parse it
+                return Result(path, skipped='which is not a music file')
+
+            with self.stopwatch.measure('parsing'):
+                track = Track.create(path, self.internal_class, self.hasher)
+            with self.stopwatch.measure('hashing'):
+                if entry:
+                    track.hash = entry['hash']
+                    track.hash_name = entry['hasher']
+                else:
+                    track.update_hash()
+                other_hashes = [other.hash(track.filename)
+                                for other in self.other_hashers]
+            copied = entry and _verified_copy(self.journal, entry,
+                                              self.database.hasher, path)
+        except Exception as failure:
+            return Result(path, error=failure)
+        return Result(path, track=track, other_hashes=other_hashes,
+                      ipod_path=entry['ipod_path'] if copied else None)
+
+    def __in_ipod(self, result):
+        return (self.database.get(result.track)
+                or any(self.database.get_by_hash(hash)
+                       for hash in result.other_hashes))
+
+    def read(self, paths):
+        """Results of the files to send, telling why not about the rest"""
+        hashes = set()  # Of the tracks to send not yet in the database
+        results = imap(self._read, paths, self.jobs)
+        try:
+            for result in results:
+                if result.error is not None:
+                    self.report('Could not read track "{}": {}'.format(
+                        result.path, result.error))
+                elif result.skipped:
+                    self.report('Not sending: "{}" {}.'.format(
+                        result.path, result.skipped))
+                elif not self.force and (result.track.hash in hashes
+                                         or self.__in_ipod(result)):
+                    self.report('Not sending: "{}" which is already in the '
+                                'ipod.'.format(result.track))
+                else:
+                    hashes.add(result.track.hash)
+                    yield result
+        finally:
+            results.close()  # No file is read once closed
+
+    def fit(self, results, free, choose=False, priority=None):
+        """The results whose files fit in the free space, in their order
+
+        When they do not fit, those which fit are chosen in the order of the
+        priority key, if any, or ValueError is raised unless choosing them.
+        """
+        results = [result for result in results]
+        sizes = {result.path: result.size for result in results}
+
+        needed = sum(sizes.itervalues())
+        if needed <= free:
+            return results
+
+        if not choose:
+            raise ValueError('The new tracks need {:.1f} MB but the iPod only '
+                             'has {:.1f} MB free, use --fit to push those '
+                             'which fit'.format(_megabytes(needed),
+                                                _megabytes(free)))
+
+        selected = set()
+        for result in sorted(results, key=priority) if priority else results:
+            if sizes[result.path] <= free:
+                free -= sizes[result.path]
+                selected.add(result.path)
+            else:
+                self.report('Not sending: "{}" which does not fit in the ipod.'
+                            .format(result.track))
+
+        return [result for result in results if result.path in selected]
+
+    def _copy(self, item):
+        path, track = item
+        self.database.copy_file(track)
+        self.journal.record(path, track.hash, track.hash_name,
+                            track.internal['ipod_path'])
+
+    def __remove_failed_copies(self, failures):
+        for (path, track), failure in failures:
+            self.report('Could not send "{}": {}'.format(track, failure))
+            self.database.remove(track)
+        return len(failures)
+
+    def push(self, results, checkpoint=None, save=_save):
+        """Add the tracks and copy their files
+
+        The database is saved by save(database) every checkpoint tracks, and
+        once the files are in the iPod. Returns the number of tracks sent.
+        """
+        copier = Consumer(self._copy, size=2 * self.jobs, threads=self.writers)
+        sent = failed = checkpointed = 0
+        try:
+            for result in results:
+                track = result.track
+                sent += 1
+                self.database.add(track)
+                if result.ipod_path:
+                    self.report('Resuming {}: {} was already copied'.format(
+                        sent, track))
+                    track.copied_to(result.ipod_path)
+                else:
+                    self.report('Sending {}: {}'.format(sent, track))
+                    copier.put((result.path, track))
+
+                if checkpoint and sent - checkpointed >= checkpoint:
+                    failed += self.__remove_failed_copies(copier.wait())
+                    save(self.database)
+                    self.journal.checkpoint()
+                    checkpointed = sent
+                    self.report('Checkpoint: saved {} tracks'.format(
+                        sent - failed))
+        finally:
+            failures = copier.close()
+
+        failed += self.__remove_failed_copies(failures)
+
+        if sent > failed:
+            self.database.sync_files()
+            save(self.database)
+            # So the files are kept if the journal cannot be removed
+            self.journal.checkpoint()
+
+        return sent - failed
+
+    def plan(self, results, free=None, fit=False, priority=None):
+        """Tell what push would send and how long it would take"""
+        results = [result for result in results]  # Every file read, hashed
+        planning = self.stopwatch.elapsed
+
+        if free is not None:
+            try:
+                results = self.fit(results, free, fit, priority)
+            except ValueError as full:
+                self.report('Warning: ' + unicode(full))
+
+        for number, result in enumerate(results, 1):
+            self.report('Would send {}: {}'.format(number, result.track))
+
+        size = sum(result.size for result in results)
+        self.report('Would send {} tracks, {:.1f} MB'.format(
+            len(results), _megabytes(size)))
+
+        rate = self.write_rate(self.journal.mountpoint)
+        if rate:
+            self.report('Writing {:.1f} MB/s into the iPod, it would take '
+                        'about {}'.format(_megabytes(rate),
+                                          _duration(size / rate)))
+        else:
+            self.report('Could not measure how fast the iPod is written')
+
+        seconds = self.stopwatch.seconds
+        self.report('Planning took {:.1f}s: discovery {:.1f}s, parsing '
+                    '{:.1f}s, hashing {:.1f}s'.format(
+                        planning, seconds['discovery'], seconds['parsing'],
+                        seconds['hashing']))
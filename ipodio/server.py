@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Server
+
+Keeps the database of an iPod loaded and indexed within a long running
+process, so read-only commands run by ipodio skip parsing the iTunesDB and
+building the index.
+
+    # Run the commands sent for the iPod at the mountpoint until interrupted
+    Server('/ipod/mountpoint', dispatch).serve_forever()
+
+    # Run a command within the server for the mountpoint, returning its exit
+    # status, or None if there is no server running
+    status = forward('/ipod/mountpoint', ['list', 'john lennon'])
+
+The server listens on a Unix domain socket named after the mountpoint. Each
+connection carries a command as a JSON line and gets back its output as JSON
+lines, ending with its exit status. Commands run one at a time, and clients
+which do not send or read in time are dropped.
+
+Sockets are only used within a directory which belongs to the user and no
+one else can read or write, as anyone able to write there could pretend to
+be the server.
+
+The database is loaded again whenever the iTunesDB changes, and dropped while
+it is missing, as when the iPod is unmounted.
+"""
+
+import os
+import sys
+import json
+import stat
+import socket
+import hashlib
+import tempfile
+
+from . import handlers
+from .console import Console
+from .sidecar import ITUNES_DIRECTORY
+
+
+CLIENT_TIMEOUT = 10  # Seconds
+
+# Commands which do not modify the database
+FORWARDED_COMMANDS = (
+    frozenset(['list']),
+    frozenset(['duplicates']),
+    frozenset(['playlist', 'list']),
+)
+
+
+def runtime_directory():
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, 'ipodio-{}'.format(os.getuid()))
+
+
+def _private(directory):
+    """Whether the directory belongs to the user, and no one else can use it"""
+    try:
+        status = os.lstat(directory)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(status.st_mode) and status.st_uid == os.getuid()
+            and stat.S_IMODE(status.st_mode) == 0o700)
+
+
+def socket_path(mount):
+    """The socket of the server for the mountpoint"""
+    name = hashlib.sha1(os.path.realpath(mount)).hexdigest()[:16]
+    return os.path.join(runtime_directory(), name + '.sock')
+
+
+class _Output(object):
+    """File-like object sending what is written to the client"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def send(self, **message):
+        self.stream.write(json.dumps(message) + '\n')
+        self.stream.flush()
+
+    def write(self, text):
+        if text:
+            self.send(output=text)
+
+    def flush(self):
+        pass
+
+
+class Server(object):
+    def __init__(self, mount, dispatch, jobs=None, hash_algorithm=None,
+                 hash_bytes=None, path=None):
+        self.mount = mount
+        self.dispatch = dispatch  # Runs a command given its arguments
+        self.options = dict(jobs=jobs, hash_algorithm=hash_algorithm,
+                            hash_bytes=hash_bytes)
+        self.path = path or socket_path(mount)
+        self.itunesdb = os.path.join(mount, ITUNES_DIRECTORY, 'iTunesDB')
+        self.signature = None
+        self.session = None
+
+    def _itunesdb_signature(self):
+        try:
+            stat = os.stat(self.itunesdb)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime, stat.st_size
+
+    def _drop(self):
+        if self.session is not None:
+            handlers.end_session(save=False)
+            self.session = None
+
+    def _load(self, signature):
+        self._drop()
+        self.session = handlers.start_session(self.mount, read_only=True,
+                                              **self.options)
+        self.signature = signature
+
+    def run(self, argv, output, width=None):
+        """Run the command writing its output, return its exit status"""
+        signature = self._itunesdb_signature()
+        if signature is None:
+            self._drop()
+            output.write('Error: The iPod at "{}" is not available\n'.format(
+                self.mount))
+            return 1
+
+        if self.session is None or signature != self.signature:
+            self._load(signature)
+
+        stdout, sys.stdout = sys.stdout, output
+        Console.forced_width = width
+        try:
+            self.dispatch(argv)
+            status = 0
+        except SystemExit as exit:
+            if isinstance(exit.code, basestring):
+                print(exit.code)
+            status = 1 if exit.code else 0
+        except Exception as failure:
+            print('Error: {}'.format(failure))
+            self._drop()  # Its state is unknown after a failure
+            return 1
+        finally:
+            sys.stdout = stdout
+            Console.forced_width = None
+
+        # New hashes are only kept when they do not modify the iTunesDB
+        database = self.session.database
+        read_only = getattr(database and database.internal, 'read_only', False)
+        if read_only:
+            self.session.save()
+
+        return status
+
+    def _handle(self, connection):
+        connection.settimeout(CLIENT_TIMEOUT)
+        stream = connection.makefile('rwb')
+        try:
+            request = json.loads(stream.readline())
+            output = _Output(stream)
+            output.send(status=self.run(request['argv'], output,
+                                        request.get('width')))
+        except (ValueError, KeyError, TypeError, socket.error):
+            pass  # Invalid requests and clients gone away
+        finally:
+            stream.close()
+
+    def _listen(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.lexists(directory):
+            os.makedirs(directory)
+            os.chmod(directory, 0o700)
+        if not _private(directory):
+            handlers.error('Refusing to listen within "{}", which must belong '
+                           'to the user and no one else'.format(directory))
+
+        if forward(self.mount, None, path=self.path) is not None:
+            handlers.error('There is a server for "{}" already'.format(
+                self.mount))
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left by a server which did not exit cleanly
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(5)
+        return listener
+
+    def serve_forever(self):
+        listener = self._listen()
+        try:
+            while True:
+                connection, _ = listener.accept()
+                try:
+                    self._handle(connection)
+                finally:
+                    connection.close()
+        finally:
+            listener.close()
+            os.remove(self.path)
+            self._drop()
+
+
+def forward(mount, argv, path=None, stdout=None):
+    """Run the command within the server for the mountpoint
+
+    The output is written into stdout and the exit status returned, or None
+    when there is no server to run it. A None command only checks whether
+    there is one.
+    """
+    path = path or socket_path(mount)
+    if not _private(os.path.dirname(path)) or not os.path.exists(path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        return None
+
+    stream = client.makefile('rwb')
+    try:
+        if argv is None:
+            return 0
+
+        request = {'argv': argv, 'width': Console().width}
+        stream.write(json.dumps(request) + '\n')
+        stream.flush()
+
+        stdout = stdout or sys.stdout
+        status = 1  # Unless the server tells otherwise
+        for line in stream:
+            message = json.loads(line)
+            if 'output' in message:
+                stdout.write(message['output'].encode('utf-8'))
+            if 'status' in message:
+                status = message['status']
+        return status
+    finally:
+        stream.close()
+        client.close()
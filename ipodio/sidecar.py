@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Sidecar
+
+Stores the hash of every track in a small file next to the iTunesDB, so the
+index can be loaded without reading each track's data.
+
+The file is only trusted while the iTunesDB keeps the modification time and
+size it had when the file was written, as any other program writing the
+iTunesDB may have changed its tracks.
+
+    sidecar = Sidecar.create('/ipod/mountpoint')
+
+    # {dbid: (hash, hasher name)} or None if missing or outdated
+    entries = sidecar.load()
+
+    # Store the entries along with the current iTunesDB modification
+    sidecar.save(entries)
+"""
+
+import os
+import json
+import tempfile
+
+
+ITUNES_DIRECTORY = os.path.join('iPod_Control', 'iTunes')
+
+
+class Sidecar(object):
+    def __init__(self, path, itunesdb_path):
+        self.path = path
+        self.itunesdb_path = itunesdb_path
+
+    @classmethod
+    def create(cls, mountpoint):
+        directory = os.path.join(mountpoint, ITUNES_DIRECTORY)
+        return cls(os.path.join(directory, 'ipodio.index'),
+                   os.path.join(directory, 'iTunesDB'))
+
+    def _itunesdb_signature(self):
+        try:
+            stat = os.stat(self.itunesdb_path)
+        except OSError:
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    def load(self):
+        signature = self._itunesdb_signature()
+        if signature is None:
+            return None
+
+        try:
+            with open(self.path) as sidecar_file:
+                data = json.load(sidecar_file)
+            if data['itunesdb'] != signature:
+                return None
+            names = data['names']
+            return {dbid: (hash, names[name])
+                    for dbid, hash, name in data['tracks']}
+        except (IOError, OSError, ValueError, KeyError, TypeError, IndexError):
+            return None
+
+    def save(self, entries):
+        """Write the entries, ignoring failures as the file is just a cache"""
+        signature = self._itunesdb_signature()
+        if signature is None:
+            return
+
+        names = sorted(set(name for hash, name in entries.itervalues()))
+        numbers = {name: number for number, name in enumerate(names)}
+        data = {
+            'itunesdb': signature,
+            'names': names,
+            'tracks': [[dbid, hash, numbers[name]]
+                       for dbid, (hash, name) in entries.iteritems()],
+        }
+
+        try:
+            descriptor, temporary = tempfile.mkstemp(
+                dir=os.path.dirname(self.path))
+        except (IOError, OSError):
+            return
+
+        try:
+            with os.fdopen(descriptor, 'w') as sidecar_file:
+                json.dump(data, sidecar_file, separators=(',', ':'))
+            os.rename(temporary, self.path)
+        except (IOError, OSError):
+            os.remove(temporary)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Sorting
+
+Orders tracks by a list of fields in a single sort. Each track gets one key,
+a tuple built from its TrackRecord, which is kept in the track until its
+fields change, so sorting again only compares tuples.
+
+Text is compared without case, accents or leading articles, so "The Beatles"
+sorts along with "Beatles" and "Álvaro" along with "Alvaro". Numeric fields,
+such as the track number, are compared as numbers.
+
+    order = parse_order('artist,year,album,track')
+    tracks = sorted_tracks(database.tracks, order)
+"""
+
+from ._helpers import fold
+
+# Sort fields as {name: TrackRecord field}
+FIELDS = {
+    'artist': 'artist',
+    'album': 'album',
+    'title': 'title',
+    'genre': 'genre',
+    'track': 'number',
+    'year': 'year',
+    'length': 'length',
+    'size': 'size',
+}
+
+TEXT_FIELDS = frozenset(['artist', 'album', 'title', 'genre'])
+
+DEFAULT_ORDER = ('artist', 'album', 'track')
+
+# The same artists, albums and genres are shared by many tracks
+_collations = {}
+MAX_COLLATIONS = 4096
+
+
+def collate(text):
+    """Key comparing text without case, accents or leading articles"""
+    try:
+        return _collations[text]
+    except KeyError:
+        pass
+
+    if len(_collations) >= MAX_COLLATIONS:
+        _collations.clear()  # Bounded, as a server sorts for a long time
+
+    key = _collations[text] = fold(text, articles=True)
+    return key
+
+
+def parse_order(text):
+    """Parse comma separated field names, raising ValueError on unknown ones"""
+    if not text:
+        return DEFAULT_ORDER
+
+    order = tuple(name.strip().lower() for name in text.split(','))
+    unknown = [name for name in order if name not in FIELDS]
+    if unknown or not all(order):
+        raise ValueError(u'Unknown sort field "{}", use any of: {}'.format(
+            u','.join(unknown), u', '.join(sorted(FIELDS))))
+    return order
+
+
+def sort_key(record, order=DEFAULT_ORDER):
+    """The key of the TrackRecord for the order"""
+    key = []
+    for name in order:
+        value = getattr(record, FIELDS[name])
+        if name in TEXT_FIELDS:
+            key.append(collate(value or u''))
+        else:
+            key.append(value or 0)
+    return tuple(key)
+
+
+def sorted_tracks(tracks, order=DEFAULT_ORDER, key=None):
+    """Sort in place the tracks, or the elements key maps to their tracks"""
+    if key is None:
+        tracks.sort(key=lambda track: track.sort_key(order))
+    else:
+        tracks.sort(key=lambda element: key(element).sort_key(order))
+    return tracks
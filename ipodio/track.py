@@ -9,41 +9,86 @@ wrapper around gpod.Track.
 Current implementation includes two hashing processes for each song file.
 
 1. gpod's default sha1 hashing accessible through gtrack['userdata']['sha1_hash]
-2. mp3hash partial hashing to avoid track's id3 tags noise in their hashes
+2. mp3hash partial hashing to avoid track's id3 tags noise in their hashes,
+   with a selectable digest algorithm (see ipodio.hashing)
 
     # Create the track without hashing the file
     track = ipodio.Track(gpod.Track('/path/to/song'))
 
     # Read file content's and obtain a hash
     # This will be stored as userdata within the gpod's own database
+    # along with the name of the hasher which computed it
     track.update_hash()
+
+The fields used to list, sort and filter tracks are read from gpod once and
+kept in a read-only TrackRecord, so they are not converted again on every
+access. Take a new snapshot after writing them into the gpod track.
+
+    track.internal['title'] = 'New title'
+    track.refresh()
+
+The key sorting the track by some fields (see ipodio.sorting) is kept along
+with the snapshot, and taken again with it.
+
+    tracks.sort(key=lambda track: track.sort_key(('artist', 'year')))
 """
 
-import gpod
-import mp3hash
+try:
+    import gpod
+except ImportError:  # Only the read-only iTunesDB reader can be used
+    gpod = None
+
+from collections import namedtuple
 
 import _helpers
+from .hashing import Hasher, DEFAULT_NAME
+from .sorting import sort_key, DEFAULT_ORDER
+
 
+def require_gpod():
+    if gpod is None:
+        raise ImportError(u'python-gpod is needed to modify the iPod')
+    return gpod
 
-class Hasher(object):
-    def hash(self, filename, maxbytes=512 * 1024):
-        return mp3hash.mp3hash(filename, maxbytes=maxbytes)
+
+class TrackRecord(namedtuple('TrackRecord', 'number title album artist genre '
+                                            'year length size dbid')):
+    """Read-only snapshot of the track fields"""
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, track):
+        return cls(number=track._get_trackdata('track_nr'),
+                   title=track._get_unicode_trackdata('title'),
+                   album=track._get_unicode_trackdata('album'),
+                   artist=track._get_unicode_trackdata('artist'),
+                   genre=track._get_unicode_trackdata('genre'),
+                   year=track._get_trackdata('year'),
+                   length=track._get_trackdata('tracklen'),
+                   size=track._get_trackdata('size'),
+                   dbid=track._get_trackdata('dbid'))
 
 
 class Track(object):
-    def __init__(self, track, hasher=Hasher()):
+    __slots__ = ('__track', '_hasher', '__record', '__sort_key')
+
+    def __init__(self, track, hasher=None):
         self.__track = track
-        self._hasher = hasher
+        self._hasher = hasher or Hasher()
+        self.__record = None
+        self.__sort_key = None
 
     @classmethod
-    def create(cls, filename, internal_class=gpod.Track):
-        return cls(internal_class(filename))
+    def create(cls, filename, internal_class=None, hasher=None):
+        internal_class = internal_class or require_gpod().Track
+        return cls(internal_class(filename), hasher=hasher)
 
     def compute_hash(self):
         return self._hasher.hash(self.filename)
 
     def update_hash(self):
         self.hash = self.compute_hash()
+        self.hash_name = self._hasher.name
 
     @property
     def _userdata(self):
@@ -60,6 +105,30 @@ class Track(object):
     def _get_unicode_trackdata(self, name):
         return unicode(self._get_trackdata(name) or '')
 
+    @property
+    def record(self):
+        if self.__record is None:
+            self.__record = TrackRecord.create(self)
+        return self.__record
+
+    def copied_to(self, ipod_path):
+        """Point the track to its file, copied into the iPod by ipodio"""
+        self.__track['ipod_path'] = ipod_path
+        self.__track['transferred'] = 1
+        self._userdata['filename_ipod'] = ipod_path
+        self._userdata['transferred'] = 1
+
+    def refresh(self):
+        """Snapshot the fields again after writing them"""
+        self.__record = None
+        self.__sort_key = None
+
+    def sort_key(self, order=DEFAULT_ORDER):
+        """Key sorting the track by the fields in order"""
+        if self.__sort_key is None or self.__sort_key[0] != order:
+            self.__sort_key = (order, sort_key(self.record, order))
+        return self.__sort_key[1]
+
     @property
     def hash(self):
         return self._userdata.get('mp3hash')
@@ -68,10 +137,25 @@ class Track(object):
     def hash(self, hash):
         self._userdata['mp3hash'] = hash
 
+    @property
+    def hash_name(self):
+        """Name of the hasher which computed the hash, if any"""
+        if self.hash:
+            return self._userdata.get('mp3hash_name', DEFAULT_NAME)
+
+    @hash_name.setter
+    def hash_name(self, name):
+        self._userdata['mp3hash_name'] = name
+
     @property
     def internal(self):
         return self.__track
 
+    @property
+    def dbid(self):
+        # Read alone, as every track's dbid is needed to wrap the database
+        return self._get_trackdata('dbid')
+
     @property
     def extension(self):
         filetype = self._get_trackdata('filetype')
@@ -101,21 +185,39 @@ class Track(object):
             filename=_helpers.clean_filename(filename),
             extension=self.extension)
 
+    @property
+    def length(self):
+        """Duration in milliseconds"""
+        return self.record.length
+
+    @property
+    def size(self):
+        """File size in bytes"""
+        return self.record.size
+
     @property
     def number(self):
-        return self._get_trackdata('track_nr')
+        return self.record.number
 
     @property
     def title(self):
-        return self._get_unicode_trackdata('title')
+        return self.record.title
 
     @property
     def album(self):
-        return self._get_unicode_trackdata('album')
+        return self.record.album
 
     @property
     def artist(self):
-        return self._get_unicode_trackdata('artist')
+        return self.record.artist
+
+    @property
+    def genre(self):
+        return self.record.genre
+
+    @property
+    def year(self):
+        return self.record.year
 
     def __str__(self):
         number = u"{}. ".format(self.number) if self.number else u""
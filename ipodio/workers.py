@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Workers
+
+Bounded pools of worker threads to overlap slow operations, such as reading
+and hashing files, while results are consumed in order by the caller.
+
+Threads are used instead of processes as the work is mostly spent reading
+files and within hashlib, which both release the GIL, and the objects being
+processed wrap libgpod structures which cannot be sent to other processes.
+
+    # Hash files using up to 4 threads, results keep the input order
+    for hash in imap(hasher.hash, filenames, jobs=4):
+        print(hash)
+
+    # Copy files one by one in the background while more are being found
+    copier = Consumer(copy_file, size=8)
+    for filename in filenames:
+        copier.put(filename)
+    failures = copier.close()
+
+    # Do not read more than 10 MiB per second among all the threads
+    limiter = RateLimiter(10 * 1024 * 1024)
+    limiter.acquire(os.path.getsize(filename))
+
+    # Add up the time every thread spends hashing
+    stopwatch = Stopwatch()
+    with stopwatch.measure('hashing'):
+        hasher.hash(filename)
+    print(stopwatch.seconds['hashing'])
+"""
+
+import time
+import Queue
+import threading
+from contextlib import contextmanager
+from collections import deque, defaultdict
+from multiprocessing.pool import ThreadPool
+
+
+def imap(function, iterable, jobs=1, buffer=None):
+    """Lazily apply function to every element using up to `jobs` threads
+
+    No more than `buffer` elements, twice the jobs by default, are taken from
+    the iterable ahead of the results consumed by the caller, so a slow
+    consumer holds back a fast producer. Closing it early drops the pending
+    elements and waits for those being processed.
+    """
+    if jobs <= 1:
+        for element in iterable:
+            yield function(element)
+        return
+
+    buffer = max(buffer or 2 * jobs, 1)
+    pool = ThreadPool(jobs)
+    pending = deque()
+    try:
+        for element in iterable:
+            pending.append(pool.apply_async(function, (element,)))
+            if len(pending) >= buffer:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+_CLOSED = object()
+
+
+class Consumer(object):
+    """Calls function on the items put into it from `threads` threads
+
+    Items are taken in the order they were put, so a single thread handles
+    them in that order, while several threads start them in that order but
+    may finish them in any other. Putting an item blocks while `size` items
+    are waiting. Failures do not stop the threads, and are returned as
+    (item, exception) by close().
+    """
+
+    def __init__(self, function, size=8, threads=1):
+        self.function = function
+        self.queue = Queue.Queue(size)
+        self.failures = []
+        self.threads = [threading.Thread(target=self.__run)
+                        for _ in range(max(threads, 1))]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def __run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _CLOSED:
+                    return
+                self.function(item)
+            except Exception as failure:
+                self.failures.append((item, failure))
+            finally:
+                self.queue.task_done()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def wait(self):
+        """Wait for the items put so far, return and forget the failures"""
+        self.queue.join()
+        failures, self.failures = self.failures, []
+        return failures
+
+    def close(self):
+        """Wait for the items put so far, return the failures"""
+        for thread in self.threads:
+            self.queue.put(_CLOSED)
+        for thread in self.threads:
+            thread.join()
+        return self.failures
+
+
+class RateLimiter(object):
+    """Paces callers so no more than `rate` units are acquired per second
+
+    Each call reserves the next free slot of time for its amount and sleeps
+    until it starts, so it can be shared by several worker threads.
+    """
+
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(u'rate must be a positive number')
+
+        self.rate = float(rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.available = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount):
+        with self.lock:
+            now = self.clock()
+            start = max(self.available, now)
+            self.available = start + amount / self.rate
+
+        if start > now:
+            self.sleep(start - now)
+
+
+class Stopwatch(object):
+    """Adds up the seconds spent in each named stage, from any thread"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.seconds = defaultdict(float)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            with self.lock:
+                self.seconds[stage] += elapsed
+
+    @property
+    def elapsed(self):
+        """Seconds since the stopwatch was created"""
+        return self.clock() - self.started
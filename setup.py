@@ -13,8 +13,7 @@ setup(
     url='https://github.com/jvrsantacruz/ipodio',
     packages=find_packages(exclude=['spec', 'spec.*']),
     install_requires=[
-        'docopt',
-        'mp3hash'
+        'docopt'
     ],
     classifiers=[
         'Environment :: Console',
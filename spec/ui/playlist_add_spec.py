@@ -32,7 +32,7 @@ with describe('ipodio playlist add') as _:
             def should_print_an_error__():
                 execution = _.env.run(*_.cmd + ['playlist', 'add', _.playlist_name], expect_error=True)
 
-                expect(execution.stderr).to.have('Usage:')
+                expect(execution.stdout).to.have('Error: Select the tracks')
 
         with context('but with a bad expression'):
             def should_print_an_error___():
@@ -58,6 +58,13 @@ with describe('ipodio playlist add') as _:
                 expect(stdout_lines).to.have.length(
                     length_of_header + number_of_songs + length_of_footer)
 
+        with context('and an artist'):
+            def should_print_the_songs_by_the_artist_to_be_added():
+                execution = _.env.run(*_.cmd + ['playlist', 'add', _.playlist_name, '--artist', 'richard stallman', '--yes'])
+
+                expect(execution.stdout).to.have('The Free Software Song')
+                expect(execution.stdout).not_to.have('Free Software Song 2')
+
         @before.each
         def setup_playlists():
             create_playlist(_.mountpoint_path, _.playlist_name)
@@ -33,6 +33,12 @@ with describe('ipodio push') as _:
 
         expect(execution.stdout.count('ending')).to.be(len(_.songs))
 
+    def should_name_the_option_given_an_invalid_number_of_writers():
+        execution = _.env.run(*_.cmd + ['push', '--writers', '0'] +
+                              _.song_paths, expect_error=True)
+
+        expect(execution.stdout).to.have('Invalid number of writers "0"')
+
     with context('with songs already in the iPod'):
         def should_refuse_to_duplicate_a_song():
             populate_ipod(_.mountpoint_path, _.songs)
@@ -17,7 +17,7 @@ with describe('ipodio rm') as _:
     def should_return_an_error_when_called_without_arguments():
         execution = _.env.run(*_.cmd + ['rm'], expect_error=True)
 
-        expect(execution.stderr).to.have("Usage:")
+        expect(execution.stdout).to.have("Error: Select the tracks")
 
     def should_return_an_error_when_rm_with_bad_expressions():
         execution = _.env.run(*_.cmd + ['rm', _.bad_expression], expect_error=True)
@@ -36,3 +36,12 @@ with describe('ipodio rm') as _:
             execution = _.env.run(*_.cmd + ['-y', 'rm', '.'])
 
             expect(execution.stdout.count('\n')).to.be(2 + len(_.songs))
+
+        def should_only_remove_the_songs_by_the_given_artist():
+            populate_ipod(_.mountpoint_path, _.songs)
+
+            execution = _.env.run(*_.cmd + ['-y', 'rm', '--artist',
+                                            'richard stallman'])
+
+            expect(execution.stdout).to.have('The Free Software Song')
+            expect(execution.stdout).not_to.have('Free Software Song 2')
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+from ipodio.hashing import audio_limits
+
+from expects import expect
+from mamba import describe, context, before
+
+
+def reader(data):
+    return lambda offset, length: data[offset:offset + length]
+
+
+def limits(data):
+    return audio_limits(reader(data), len(data))
+
+
+def id3v2(size, version=3, flags=0):
+    syncsafe = [(size >> shift) & 0x7f for shift in (21, 14, 7, 0)]
+    return b'ID3' + struct.pack('>BBB4B', version, 0, flags, *syncsafe) + b'\0' * size
+
+
+def ape(size, header=False):
+    flags = 1 << 31 if header else 0
+    items = b'\0' * (size - 32)
+    footer = b'APETAGEX' + struct.pack('<IIII', 2000, size, 0, flags) + b'\0' * 8
+    return (footer if header else b'') + items + footer
+
+
+with describe('audio_limits') as _:
+
+    with context('for files without tags'):
+        def should_be_the_whole_file():
+            expect(limits(_.audio)).to.be.equal((0, len(_.audio)))
+
+    with context('for files with an ID3v2 tag'):
+        def should_skip_the_tag():
+            expect(limits(id3v2(20) + _.audio)).to.be.equal((30, 30 + len(_.audio)))
+
+        def should_skip_the_ID3v24_footer():
+            data = id3v2(20, version=4, flags=0x10) + b'\0' * 10 + _.audio
+
+            expect(limits(data)).to.be.equal((40, 40 + len(_.audio)))
+
+    with context('for files with an ID3v1 tag'):
+        def should_skip_the_tag_():
+            data = _.audio + _.id3v1
+
+            expect(limits(data)).to.be.equal((0, len(_.audio)))
+
+        def should_skip_the_extended_tag():
+            data = _.audio + b'TAG+' + b'\0' * 223 + _.id3v1
+
+            expect(limits(data)).to.be.equal((0, len(_.audio)))
+
+    with context('for files with an APE tag'):
+        def should_skip_the_tag__():
+            expect(limits(_.audio + ape(64))).to.be.equal((0, len(_.audio)))
+
+        def should_skip_the_tag_header():
+            data = _.audio + ape(64, header=True)
+
+            expect(limits(data)).to.be.equal((0, len(_.audio)))
+
+        def should_skip_the_tag_before_an_ID3v1_tag():
+            data = _.audio + ape(64) + _.id3v1
+
+            expect(limits(data)).to.be.equal((0, len(_.audio)))
+
+    with context('for files with every tag'):
+        def should_be_only_the_audio():
+            data = id3v2(20) + _.audio + ape(64, header=True) + _.id3v1
+
+            expect(limits(data)).to.be.equal((30, 30 + len(_.audio)))
+
+    @before.all
+    def fixture():
+        _.audio = b'\xff\xfb' + b'\x01' * 1000
+        _.id3v1 = b'TAG' + b'\0' * 125
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+
+from ipodio.cache import HashCache
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(HashCache) as _:
+
+    with context('when created'):
+        def should_be_empty():
+            expect(_.cache.entries).to.be.empty
+
+        def should_be_marked_as_not_updated():
+            expect(_.cache.updated).to.be.false
+
+    with context('when calling get'):
+        def should_return_no_hash_for_unknown_files():
+            signature, hash = _.cache.get(_.song, 'tag')
+
+            expect(hash).to.be.none
+
+        def should_return_no_signature_for_missing_files():
+            signature, hash = _.cache.get(_.missing, 'tag')
+
+            expect(signature).to.be.none
+
+        def should_return_the_hash_for_known_files():
+            signature, _hash = _.cache.get(_.song, 'tag')
+            _.cache.set(_.song, signature, _.hash)
+
+            signature, hash = _.cache.get(_.song, 'tag')
+
+            expect(hash).to.be.equal(_.hash)
+
+        def should_not_return_the_hash_for_other_tags():
+            signature, _hash = _.cache.get(_.song, 'tag')
+            _.cache.set(_.song, signature, _.hash)
+
+            signature, hash = _.cache.get(_.song, 'other tag')
+
+            expect(hash).to.be.none
+
+        def should_not_be_marked_as_updated_when_found():
+            signature, _hash = _.cache.get(_.song, 'tag')
+            _.cache.set(_.song, signature, _.hash)
+            _.cache.updated = False
+
+            _.cache.get(_.song, 'tag')
+
+            expect(_.cache.updated).to.be.false
+
+        def should_not_return_the_hash_for_modified_files():
+            signature, _hash = _.cache.get(_.song, 'tag')
+            _.cache.set(_.song, signature, _.hash)
+
+            with open(_.song, 'a') as song:
+                song.write('more data')
+
+            signature, hash = _.cache.get(_.song, 'tag')
+
+            expect(hash).to.be.none
+
+    with context('when saved'):
+        def should_be_loaded_back():
+            signature, _hash = _.cache.get(_.song, 'tag')
+            _.cache.set(_.song, signature, _.hash)
+            _.cache.save()
+
+            cache = HashCache.create(_.cache.path)
+
+            expect(cache.get(_.song, 'tag')[1]).to.be.equal(_.hash)
+
+        def should_load_back_paths_with_non_ascii_names():
+            song = os.path.join(_.directory, u'canción.mp3'.encode('utf-8'))
+            _.store(song)
+
+            cache = HashCache.create(_.cache.path)
+
+            expect(cache.get(song, 'tag')[1]).to.be.equal(_.hash)
+
+        def should_load_back_paths_which_cannot_be_decoded():
+            song = os.path.join(_.directory, u'canción.mp3'.encode('latin-1'))
+            _.store(song)
+
+            cache = HashCache.create(_.cache.path)
+
+            expect(cache.get(song, 'tag')[1]).to.be.equal(_.hash)
+
+        def should_evict_least_recently_used_entries_beyond_max_entries():
+            cache = HashCache(_.cache.path, max_entries=1)
+            cache.set('old', [1, 1, 1.0, 'tag'], 'old hash')
+            cache.set('new', [1, 1, 1.0, 'tag'], 'new hash')
+            cache.entries['old'][5] = 0
+
+            cache.save()
+
+            expect(HashCache.create(cache.path).entries.keys()).to.be.equal(['new'])
+
+    with context('when shared by several threads'):
+        def should_save_while_other_threads_set_entries():
+            _.cache.max_entries = 10
+            signature, _hash = _.cache.get(_.song, 'tag')
+
+            def set_entries():
+                for number in range(20000):
+                    _.cache.set(_.song + str(number), signature, _.hash)
+            threads = [threading.Thread(target=set_entries) for n in range(2)]
+            for thread in threads:
+                thread.start()
+            while any(thread.is_alive() for thread in threads):
+                _.cache.save()
+            for thread in threads:
+                thread.join()
+
+            expect(HashCache.create(_.cache.path).entries).not_to.be.empty
+
+    with context('when loading a corrupted file'):
+        def should_be_empty_():
+            os.mkdir(os.path.dirname(_.cache.path))
+            with open(_.cache.path, 'w') as cache_file:
+                cache_file.write('{corrupted')
+
+            expect(HashCache.create(_.cache.path).entries).to.be.empty
+
+    @before.each
+    def fixture():
+        _.directory = tempfile.mkdtemp()
+        _.song = os.path.join(_.directory, 'song.mp3')
+        _.missing = os.path.join(_.directory, 'missing.mp3')
+        _.hash = '204939024023840234'
+        with open(_.song, 'w') as song:
+            song.write('data')
+        _.cache = HashCache(os.path.join(_.directory, 'cache', 'hashes.json'))
+
+        def store(song):
+            with open(song, 'w') as song_file:
+                song_file.write('data')
+            signature, _hash = _.cache.get(song, 'tag')
+            _.cache.set(song, signature, _.hash)
+            _.cache.save()
+        _.store = store
+
+    @after.each
+    def cleanup():
+        shutil.rmtree(_.directory)
+
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from ipodio.cache import CachedHasher
+
+from expects import expect
+from mockito import mock, when, verify, any
+from mamba import describe, context, before
+
+
+with describe(CachedHasher) as _:
+
+    with context('when calling hash'):
+        def should_hash_the_file_on_a_cache_miss():
+            _.hasher.hash(_.filename)
+
+            verify(_.inner_hasher).hash(_.filename)
+
+        def should_store_the_hash_on_a_cache_miss():
+            _.hasher.hash(_.filename)
+
+            verify(_.cache).set(_.filename, _.signature, _.hash)
+
+        def should_not_hash_the_file_on_a_cache_hit():
+            when(_.cache).get(_.filename, any()).thenReturn((_.signature, _.hash))
+
+            expect(_.hasher.hash(_.filename)).to.be.equal(_.hash)
+            verify(_.inner_hasher, times=0).hash(any())
+
+        def should_look_for_hashes_made_by_the_same_hasher():
+            _.hasher.hash(_.filename)
+
+            verify(_.cache).get(_.filename, _.inner_hasher.name)
+
+    @before.each
+    def fixture():
+        _.filename = u'filename.mp3'
+        _.hash = '204939024023840234'
+        _.signature = [1, 2, 3.0, 'tag']
+        _.cache = mock()
+        when(_.cache).get(_.filename, any()).thenReturn((_.signature, None))
+        _.inner_hasher = mock()
+        _.inner_hasher.name = u'sha1:524288'
+        when(_.inner_hasher).hash(_.filename).thenReturn(_.hash)
+        _.hasher = CachedHasher(_.inner_hasher, _.cache)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from ipodio import copier as module
+from ipodio.copier import Copier, copy_data, free_space, measure_write_rate
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(Copier) as _:
+
+    with context('when copying a file'):
+        def should_place_it_within_a_music_directory():
+            ipod_path = _.copier.copy(_.source)
+
+            parts = ipod_path.split(u':')
+            expect(parts[:4]).to.be.equal([u'', u'iPod_Control', u'Music', u'F01'])
+            expect(parts[4]).to.match(r'^[A-Z]{4}\.mp3$')
+
+        def should_copy_its_contents():
+            ipod_path = _.copier.copy(_.source)
+
+            with open(os.path.join(_.mountpoint, *ipod_path.split(u':'))) as copy:
+                expect(copy.read()).to.be.equal(_.data)
+
+        def should_count_the_files_and_bytes():
+            _.copier.copy(_.source)
+            _.copier.copy(_.source)
+
+            expect(_.copier.files).to.be.equal(2)
+            expect(_.copier.bytes).to.be.equal(2 * len(_.data))
+
+    with context('when the system calls cannot be used'):
+        def should_copy_through_a_buffer():
+            functions = module._copy_file_range, module._sendfile
+            module._copy_file_range = module._sendfile = None
+            try:
+                with open(_.source, 'rb') as source:
+                    with open(_.target, 'wb') as target:
+                        copied = copy_data(source.fileno(), target.fileno(),
+                                           len(_.data), buffer_size=7)
+            finally:
+                module._copy_file_range, module._sendfile = functions
+
+            expect(copied).to.be.equal(len(_.data))
+            with open(_.target, 'rb') as target:
+                expect(target.read()).to.be.equal(_.data)
+
+    with context('when the file changes size while being copied'):
+        def should_raise_IOError_leaving_nothing_behind():
+            copy_data, module.copy_data = module.copy_data, lambda *args: 1
+            try:
+                expect(lambda: _.copier.copy(_.source)).to.raise_error(IOError)
+            finally:
+                module.copy_data = copy_data
+
+            music = os.path.join(_.mountpoint, 'iPod_Control', 'Music', 'F01')
+            expect(os.listdir(music)).to.be.empty
+            expect(_.copier.files).to.be.equal(0)
+
+    with context('when there are no music directories'):
+        def should_create_one():
+            shutil.rmtree(os.path.join(_.mountpoint, 'iPod_Control'))
+
+            ipod_path = _.copier.copy(_.source)
+
+            expect(ipod_path).to.match(r'^:iPod_Control:Music:F00:')
+
+    with context('when the source cannot be read'):
+        def should_raise_OSError_without_counting_it():
+            call = lambda: _.copier.copy(os.path.join(_.mountpoint, 'missing.mp3'))
+
+            expect(call).to.raise_error(OSError)
+            expect(_.copier.files).to.be.equal(0)
+
+    with context('when telling the free space'):
+        def should_leave_room_for_the_database():
+            stat = os.statvfs(_.mountpoint)
+            available = stat.f_bavail * stat.f_frsize
+
+            expect(free_space(_.mountpoint, reserved=1024)).to.be.equal(
+                max(available - 1024, 0))
+
+        def should_return_None_when_not_mounted():
+            expect(free_space(os.path.join(_.mountpoint, 'missing'))).to.be.none
+
+    with context('when measuring the write rate'):
+        def should_write_a_file_and_remove_it():
+            rate = measure_write_rate(_.mountpoint, size=1024 * 1024)
+
+            expect(rate).to.be.above(0)
+            expect(os.listdir(os.path.join(_.mountpoint, 'iPod_Control'))).to.be.equal(
+                ['Music'])
+
+        def should_return_None_when_it_cannot_write():
+            expect(measure_write_rate(os.path.join(_.mountpoint, 'missing'))).to.be.none
+
+    @before.each
+    def copier_fixture():
+        _.mountpoint = tempfile.mkdtemp()
+        os.makedirs(os.path.join(_.mountpoint, 'iPod_Control', 'Music', 'F01'))
+        _.data = b'ID3' + os.urandom(100000)
+        _.source = os.path.join(_.mountpoint, 'Song.MP3')
+        _.target = os.path.join(_.mountpoint, 'copy.mp3')
+        with open(_.source, 'wb') as source:
+            source.write(_.data)
+        _.copier = Copier(_.mountpoint, sync_every=1)
+
+    @after.each
+    def copier_cleanup():
+        _.copier.sync()
+        shutil.rmtree(_.mountpoint)
@@ -1,14 +1,16 @@
 #-*- coding: utf-8 -*-
 
 
-from spec.unit.fixtures import Internal, patch_gpod_module
+from spec.unit.fixtures import Internal, InternalPlaylist, patch_gpod_module
 
 gpod = patch_gpod_module()
 
 from ipodio.track import Track
-from ipodio.database import Database
+from ipodio.database import Database, Playlist
+from ipodio.hashing import Hasher, DEFAULT_NAME
 
 from expects import expect
+from mockito import mock, when, verify, any
 from mamba import describe, context, before
 
 
@@ -52,6 +54,9 @@ with describe(Database) as _:
             def should_return_a_track_with_the_given_hash():
                 expect(_.database.get_by_hash(_.hash)).to.have.property('hash', _.hash)
 
+        def should_know_the_hasher_names_in_the_index():
+            expect(_.database.hash_names).to.be.equal(set([DEFAULT_NAME]))
+
         with context('when accessing tracks'):
             def should_be_a_collection():
                 expect(_.database.tracks).not_to.be.empty
@@ -60,10 +65,369 @@ with describe(Database) as _:
         def fixture():
             _.database.update_index()
 
+    with context('when updating index with unhashed tracks'):
+        def should_hash_the_tracks():
+            expect(_.unhashed_database.tracks[0].hash).not_to.be.none
+
+        def should_index_the_tracks_by_their_new_hash():
+            for track in _.unhashed_database.tracks:
+                expect(_.unhashed_database.find_by_hash(track.hash)).not_to.be.empty
+
+        def should_be_marked_as_updated():
+            expect(_.unhashed_database.updated).to.be.true
+
+        @before.all
+        def unhashed_fixture():
+            _.unhashed_database = Database(Internal([
+                Internal({'userdata': {}, 'filename_locale': 'fixtures/song1.mp3'}),
+                Internal({'userdata': {}, 'filename_locale': 'fixtures/song2.mp3'}),
+            ]))
+            _.unhashed_database.update_index(jobs=2)
+
+    with context('when updating index with tracks hashed by other hashers'):
+        def should_index_them_by_their_own_hash():
+            expect(_.migrated_database.get_by_hash('not a crc32 hash')).not_to.be.none
+
+        def should_not_hash_them_again():
+            expect(_.migrated_database.updated).to.be.false
+
+        @before.all
+        def migrated_fixture():
+            _.hasher = Hasher('crc32')
+            _.migrated_database = Database(Internal([
+                Internal({'userdata': {'mp3hash': 'not a crc32 hash'},
+                          'filename_locale': 'fixtures/song1.mp3'}),
+            ]), hasher=_.hasher)
+            _.migrated_database.update_index()
+
+    with context('when getting the hash of a track hashed by another hasher'):
+        def should_hash_it_again_with_the_database_hasher():
+            track = _.migrating_database.tracks[0]
+
+            hash = _.migrating_database.get_hash(track)
+
+            expect(hash).to.be.equal(_.hasher.hash('fixtures/song1.mp3'))
+            expect(track.hash_name).to.be.equal(_.hasher.name)
+
+        def should_index_it_by_its_new_hash():
+            track = _.migrating_database.tracks[0]
+
+            hash = _.migrating_database.get_hash(track)
+
+            expect(_.migrating_database.get_by_hash(hash)).to.be(track)
+            expect(_.migrating_database.index).not_to.have.key('not a crc32 hash')
+
+        @before.each
+        def migrating_fixture():
+            _.hasher = Hasher('crc32')
+            _.migrating_database = Database(Internal([
+                Internal({'userdata': {'mp3hash': 'not a crc32 hash'},
+                          'filename_locale': 'fixtures/song1.mp3'}),
+            ]), hasher=_.hasher)
+            _.migrating_database.update_index()
+
+    with context('when finding duplicates'):
+        def should_group_tracks_with_the_same_audio():
+            expect(_.duplicate_groups).to.have.length(1)
+            expect([track.internal for track in _.duplicate_groups[0]]).to.have(
+                *[track.internal for track in _.duplicate_tracks[:2]])
+
+        def should_not_hash_tracks_with_an_unique_length():
+            expect(_.duplicate_tracks[3].hash).to.be.none
+
+        def should_hash_tracks_with_similar_lengths():
+            expect(_.duplicate_tracks[2].hash).not_to.be.none
+
+        def should_only_hash_tracks_of_the_same_length_by_default():
+            tracks = [Track(Internal({'userdata': {}, 'tracklen': length,
+                                      'filename_locale': 'fixtures/song1.mp3'}))
+                      for length in (1000, 1001, 1001)]
+            database = Database(Internal([t.internal for t in tracks]))
+
+            database.find_duplicates()
+
+            expect(database.tracks[0].hash).to.be.none
+            expect(database.tracks[1].hash).not_to.be.none
+
+        def should_group_tracks_without_length_by_size():
+            tracks = [Track(Internal({'userdata': {}, 'size': 10,
+                                      'filename_locale': 'fixtures/song2.mp3'}))
+                      for n in range(2)]
+            database = Database(Internal([t.internal for t in tracks]))
+
+            expect(database.find_duplicates()).to.have.length(1)
+
+        @before.all
+        def duplicates_fixture():
+            _.duplicates_database = Database(Internal([
+                Internal({'userdata': {}, 'tracklen': 1000,
+                          'filename_locale': 'fixtures/song1.mp3'}),
+                Internal({'userdata': {}, 'tracklen': 1500,
+                          'filename_locale': 'fixtures/subfixtures/song1.mp3'}),
+                Internal({'userdata': {}, 'tracklen': 2000,
+                          'filename_locale': 'fixtures/song2.mp3'}),
+                Internal({'userdata': {}, 'tracklen': 9000,
+                          'filename_locale': 'fixtures/song2.mp3'}),
+            ]))
+            _.duplicate_groups = _.duplicates_database.find_duplicates(
+                tolerance=1000)
+            _.duplicate_tracks = _.duplicates_database.tracks
+
+    with context('when updating index with an up to date sidecar'):
+        def should_index_the_tracks_without_hashing_them():
+            expect(_.sidecar_database.find_by_hash(_.hash)).not_to.be.empty
+
+        def should_not_be_marked_as_updated_():
+            expect(_.sidecar_database.updated).to.be.false
+
+        @before.all
+        def sidecar_fixture():
+            sidecar = mock()
+            when(sidecar).load().thenReturn({1234: ('204939024023840234', DEFAULT_NAME)})
+            _.sidecar_database = Database(Internal([
+                Internal({'userdata': {}, 'dbid': 1234,
+                          'filename_locale': '/not/a/file.mp3'}),
+            ]), sidecar=sidecar)
+            _.sidecar_database.update_index()
+
+    with context('when finding duplicates with an up to date sidecar'):
+        def should_group_the_tracks_by_their_stored_hashes():
+            expect(_.stored_duplicates).to.have.length(1)
+
+        def should_not_hash_the_tracks():
+            expect(_.stored_database.updated).to.be.false
+
+        @before.all
+        def stored_duplicates_fixture():
+            hasher = Hasher(maxbytes=None)
+            sidecar = mock()
+            when(sidecar).load().thenReturn({1: ('abc', hasher.name),
+                                             2: ('abc', hasher.name)})
+            _.stored_database = Database(Internal([
+                Internal({'userdata': {}, 'dbid': dbid, 'tracklen': 1000,
+                          'filename_locale': '/not/a/file.mp3'})
+                for dbid in (1, 2)]), hasher=hasher, sidecar=sidecar)
+            _.stored_duplicates = _.stored_database.find_duplicates()
+
+    with context('when finding duplicates of tracks missing from the sidecar'):
+        def should_store_their_hashes_in_the_sidecar():
+            sidecar = mock()
+            when(sidecar).load().thenReturn(None)
+            database = Database(Internal([
+                Internal({'userdata': {}, 'dbid': dbid, 'tracklen': 1000,
+                          'filename_locale': 'fixtures/song1.mp3'})
+                for dbid in (1, 2)]), sidecar=sidecar)
+
+            database.find_duplicates()
+
+            verify(sidecar).save(any())
+
+    with context('when wrapping tracks'):
+        def should_return_the_same_wrappers_every_time():
+            expect(_.wrapped_database.tracks[0]).to.be(_.wrapped_database.tracks[0])
+
+        def should_return_a_new_list_every_time():
+            expect(_.wrapped_database.tracks).not_to.be(_.wrapped_database.tracks)
+
+        def should_find_the_tracks_by_dbid():
+            track = _.wrapped_database.get_by_dbid(1234)
+
+            expect(track).to.be(_.wrapped_database.tracks[0])
+
+        def should_return_None_for_unknown_dbids():
+            expect(_.wrapped_database.get_by_dbid(4321)).to.be.none
+
+        def should_share_the_wrappers_with_playlists():
+            playlist = Playlist(Internal([_.wrapped_internal]),
+                                database=_.wrapped_database)
+
+            expect(playlist.tracks[0]).to.be(_.wrapped_database.tracks[0])
+
+        def should_share_the_wrappers_with_the_index():
+            _.wrapped_database.update_index()
+
+            expect(_.wrapped_database.get_by_hash(_.hash)).to.be(
+                _.wrapped_database.tracks[0])
+
+        @before.all
+        def wrapped_fixture():
+            _.wrapped_internal = Internal({'userdata': {'mp3hash': '204939024023840234'},
+                                           'dbid': 1234})
+            _.wrapped_database = Database(Internal([_.wrapped_internal]))
+
+    with context('when removing an indexed track'):
+        def should_remove_it_from_the_index():
+            expect(_.removal_database.find_by_hash('abc')).to.be.empty
+
+        def should_not_keep_empty_groups_in_the_index():
+            expect(_.removal_database.index).not_to.have.key('abc')
+
+        def should_keep_the_other_tracks_with_the_same_hash():
+            expect(_.removal_database.find_by_hash('def')).to.have.length(1)
+
+        def should_keep_the_wrappers_of_the_other_tracks():
+            database = Database(Internal([Internal({'userdata': {}, 'dbid': 1})]))
+            added = Track(Internal({'userdata': {'mp3hash': 'abc'}}))
+            database.add(added)
+
+            database.remove(database.get_by_dbid(1))
+
+            expect(database.tracks).to.have.length(1)
+            expect(database.tracks[0]).to.be(added)
+
+        def should_find_it_again_once_added():
+            database = Database(Internal([]))
+            database.update_index()
+            track = Track(Internal({'userdata': {'mp3hash': 'abc'}}))
+
+            database.add(track)
+            database.remove(track)
+            database.add(track)
+
+            expect(database.get_by_hash('abc')).to.be(track)
+
+        @before.all
+        def removal_fixture():
+            _.removal_database = Database(Internal([
+                Internal({'userdata': {'mp3hash': 'abc'}, 'dbid': 1}),
+                Internal({'userdata': {'mp3hash': 'def'}, 'dbid': 2}),
+                Internal({'userdata': {'mp3hash': 'def'}, 'dbid': 3}),
+            ]))
+            _.removal_database.update_index()
+            for dbid in (1, 2):
+                _.removal_database.remove(_.removal_database.get_by_dbid(dbid))
+
+    with context('when copying files with a copier'):
+        def should_point_the_track_to_the_copied_file():
+            copier = mock()
+            when(copier).copy(u'/music/song.mp3').thenReturn(
+                u':iPod_Control:Music:F00:ABCD.mp3')
+            database = Database(Internal([]), copier=copier)
+            track = Track(Internal({'filename_locale': u'/music/song.mp3',
+                                    'userdata': {}}))
+
+            database.copy_file(track)
+
+            expect(track.internal['ipod_path']).to.be.equal(
+                u':iPod_Control:Music:F00:ABCD.mp3')
+            expect(track.internal['userdata']['transferred']).to.be.equal(1)
+
+    with context('when hashing indexed tracks again'):
+        def should_move_them_to_their_new_hash():
+            track = _.rehashed_database.tracks[0]
+
+            expect(_.rehashed_database.find_by_hash(track.hash)).to.have(track)
+            expect(_.rehashed_database.index).not_to.have.key('not a crc32 hash')
+
+        @before.all
+        def rehashed_fixture():
+            _.rehashed_database = Database(Internal([
+                Internal({'userdata': {'mp3hash': 'not a crc32 hash'}, 'tracklen': 1000,
+                          'filename_locale': 'fixtures/song1.mp3'}),
+                Internal({'userdata': {'mp3hash': 'not a crc32 hash'}, 'tracklen': 1000,
+                          'filename_locale': 'fixtures/song2.mp3'}),
+            ]), hasher=Hasher('crc32'))
+            _.rehashed_database.update_index()
+            _.rehashed_database.find_duplicates()
+
+    with context('when finding by fields'):
+        def should_find_the_tracks_ignoring_case():
+            tracks = _.fields_database.find_by_fields(artist='JOHN LENNON')
+
+            expect([track.title for track in tracks]).to.be.equal(
+                [u'Imagine', u'Working Class Hero'])
+
+        def should_find_the_tracks_ignoring_accents():
+            tracks = _.fields_database.find_by_fields(artist=u'Jöhn Lénnon')
+
+            expect(tracks).to.have.length(2)
+
+        def should_find_the_tracks_matching_every_field():
+            tracks = _.fields_database.find_by_fields(artist='john lennon',
+                                                      album='imagine')
+
+            expect([track.title for track in tracks]).to.be.equal([u'Imagine'])
+
+        def should_return_an_empty_list_when_nothing_matches():
+            expect(_.fields_database.find_by_fields(genre='jazz')).to.be.empty
+
+        def should_return_every_track_without_fields():
+            expect(_.fields_database.find_by_fields()).to.have.length(3)
+
+        def should_raise_ValueError_for_unknown_fields():
+            call = lambda: _.fields_database.find_by_fields(year='1971')
+
+            expect(call).to.raise_error(ValueError)
+
+        def should_find_the_tracks_added_later():
+            _.fields_database.add(Track(Internal({'userdata': {'mp3hash': 'abc'},
+                                                  'artist': 'Johnny Cash',
+                                                  'title': 'One'})))
+
+            expect(_.fields_database.find_by_fields(artist='johnny cash')).to.have.length(2)
+
+        def should_find_the_tracks_by_their_new_fields_once_refreshed():
+            track = _.fields_database.find_by_fields(title='solitary man')[0]
+            track.internal['artist'] = 'The Man in Black'
+
+            _.fields_database.refresh(track)
+
+            expect(_.fields_database.find_by_fields(
+                artist='the man in black')).to.have.length(1)
+            expect(_.fields_database.find_by_fields(
+                title='solitary man', artist='johnny cash')).to.be.empty
+
+        def should_not_find_the_tracks_once_removed():
+            track = _.fields_database.find_by_fields(title='imagine')[0]
+
+            _.fields_database.remove(track)
+
+            expect(_.fields_database.find_by_fields(title='imagine')).to.be.empty
+
+        @before.all
+        def fields_fixture():
+            _.fields_database = Database(Internal([
+                Internal({'userdata': {}, 'artist': 'John Lennon',
+                          'album': 'Imagine', 'title': 'Imagine', 'genre': 'Rock'}),
+                Internal({'userdata': {}, 'artist': 'John Lennon',
+                          'album': 'Working Class Hero', 'title': 'Working Class Hero',
+                          'genre': 'Rock'}),
+                Internal({'userdata': {}, 'artist': 'Johnny Cash',
+                          'album': 'American III', 'title': 'Solitary Man',
+                          'genre': 'Country'}),
+            ]))
+
     with context('the playlists property'):
         def should_be_a_list():
             expect(_.database.playlists).to.be.a(list)
 
+    with context('when finding playlists by name'):
+        def should_find_the_playlist():
+            expect(_.playlists_database.get_playlist('first').internal).to.be(
+                _.first_playlist)
+
+        def should_find_the_first_of_several_with_the_same_name():
+            expect(_.playlists_database.get_playlist('same').internal).to.be(
+                _.same_playlist)
+
+        def should_return_None_for_unknown_names():
+            expect(_.playlists_database.get_playlist('unknown')).to.be.none
+
+        def should_find_renamed_playlists_by_their_new_name():
+            playlist = _.playlists_database.get_playlist('first')
+
+            _.playlists_database.rename_playlist(playlist, 'renamed')
+
+            expect(_.playlists_database.get_playlist('renamed')).to.be(playlist)
+            expect(_.playlists_database.get_playlist('first')).to.be.none
+
+        @before.all
+        def playlists_fixture():
+            _.first_playlist = InternalPlaylist('first')
+            _.same_playlist = InternalPlaylist('same')
+            _.playlists_database = Database(Internal([], playlists=[
+                _.first_playlist, _.same_playlist, InternalPlaylist('same')]))
+
     @before.all
     def fixtures():
         _.internal_class = Internal
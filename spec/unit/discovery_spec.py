@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from ipodio import discovery
+from ipodio.discovery import find_files, is_audio
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+def names(paths):
+    return [os.path.relpath(path, _.directory) for path in paths]
+
+
+with describe('discovery') as _:
+
+    with context('when finding files'):
+        def should_only_take_music_files_from_directories():
+            expect(names(find_files([_.directory]))).to.be.equal(
+                ['a.mp3', 'b.M4A'])
+
+        def should_walk_subdirectories_when_recursive():
+            found = names(find_files([_.directory], recursive=True))
+
+            expect(found).to.be.equal(
+                ['a.mp3', 'b.M4A', os.path.join('Album', 'c.mp3'),
+                 os.path.join('Demos', 'd.mp3')])
+
+        def should_take_the_files_given_whatever_their_extension():
+            path = os.path.join(_.directory, 'cover.jpg')
+
+            expect(list(find_files([path, _.directory]))[0]).to.be.equal(path)
+
+        def should_skip_what_matches_the_exclude_patterns():
+            found = names(find_files([_.directory], recursive=True,
+                                     exclude=['Demos', '*.m4a', '*.M4A']))
+
+            expect(found).to.be.equal(['a.mp3', os.path.join('Album', 'c.mp3')])
+
+        def should_find_the_same_without_scandir():
+            scandir, discovery.scandir = discovery.scandir, None
+            try:
+                found = names(find_files([_.directory], recursive=True))
+            finally:
+                discovery.scandir = scandir
+
+            expect(found).to.have.length(4)
+
+        def should_yield_files_as_they_are_found():
+            files = find_files([_.directory])
+
+            expect(next(files)).to.be.equal(os.path.join(_.directory, 'a.mp3'))
+
+    with context('when telling music files'):
+        def should_recognise_their_first_bytes():
+            expect(is_audio(os.path.join(_.directory, 'a.mp3'))).to.be.true
+            expect(is_audio(os.path.join(_.directory, 'b.M4A'))).to.be.true
+
+        def should_reject_other_files():
+            expect(is_audio(os.path.join(_.directory, 'cover.jpg'))).to.be.false
+
+    @before.each
+    def discovery_fixture():
+        _.directory = tempfile.mkdtemp()
+        files = {
+            'a.mp3': b'ID3\x03\x00',
+            'b.M4A': b'\x00\x00\x00\x20ftypM4A ',
+            'cover.jpg': b'\xff\xd8\xff\xe0',
+            'notes.nfo': b'Ripped by',
+            os.path.join('Album', 'c.mp3'): b'\xff\xfb\x90\x00',
+            os.path.join('Demos', 'd.mp3'): b'ID3',
+        }
+        for name, data in files.items():
+            path = os.path.join(_.directory, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as song:
+                song.write(data)
+
+    @after.each
+    def discovery_cleanup():
+        shutil.rmtree(_.directory)
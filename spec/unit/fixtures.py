@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import os
+import struct
+import hashlib
+
 from mockito import mock
 
 
@@ -18,8 +22,9 @@ def patch_gpod_module():
 class Internal(object):
     _itdb = None
 
-    def __init__(self, foo=None):
+    def __init__(self, foo=None, playlists=None):
         self.data = foo
+        self.Playlists = playlists or []
 
     def __iter__(self):
         return iter(self.data)
@@ -33,9 +38,111 @@ class Internal(object):
     def get(self, name, default=None):
         return self.data.get(name, default)
 
+    def add(self, item):
+        self.data.append(item)
+
+    def remove(self, item, **kwargs):
+        self.data.remove(item)
+
+    @property
+    def Master(self):
+        return Internal([])
+
     def ipod_filename(self):
         return self.data.get('filename_locale', 'filename.mp3')
 
-    @property
-    def Playlists(self):
-        return []
+
+class InternalPlaylist(Internal):
+    def __init__(self, name, tracks=None):
+        super(InternalPlaylist, self).__init__(tracks or [])
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+    def set_name(self, name):
+        self.name = name
+
+    def get_master(self):
+        return False
+
+
+def _header(magic, length, total, fields):
+    header = bytearray(length)
+    struct.pack_into('<4sII', header, 0, magic, length, total)
+    for offset, (format, value) in fields.items():
+        struct.pack_into(format, header, offset, value)
+    return bytes(header)
+
+
+def _record(magic, length, children, **fields):
+    fields = {offset: value for offset, value in fields.values()}
+    return _header(magic, length, length + len(children), fields) + children
+
+
+def itunesdb_string(type, text):
+    encoded = text.encode('utf-16-le')
+    body = struct.pack('<IIII', 1, len(encoded), 1, 0) + encoded
+    return _record(b'mhod', 24, body, type=(12, ('<I', type)))
+
+
+def itunesdb(tracks, playlists=()):
+    """Build an iTunesDB with the given tracks and playlists
+
+    Tracks are dicts with id, dbid, size, tracklen, track_nr and strings
+    as {mhod type: text}. Playlists are (name, master, [track ids]).
+    """
+    items = b''
+    for track in tracks:
+        strings = b''.join(itunesdb_string(type, text)
+                           for type, text in track.get('strings', {}).items())
+        items += _record(b'mhit', 388, strings,
+                         mhods=(12, ('<I', len(track.get('strings', {})))),
+                         id=(16, ('<I', track['id'])),
+                         size=(36, ('<I', track.get('size', 0))),
+                         tracklen=(40, ('<I', track.get('tracklen', 0))),
+                         track_nr=(44, ('<I', track.get('track_nr', 0))),
+                         dbid=(112, ('<Q', track.get('dbid', 0))))
+    track_list = _header(b'mhlt', 92, len(tracks), {}) + items
+
+    items = b''
+    for name, master, track_ids in playlists:
+        entries = b''.join(_record(b'mhip', 76, b'', id=(24, ('<I', track_id)))
+                           for track_id in track_ids)
+        items += _record(b'mhyp', 108, itunesdb_string(1, name) + entries,
+                         mhods=(12, ('<I', 1)),
+                         mhips=(16, ('<I', len(track_ids))),
+                         master=(20, ('<B', int(master))))
+    playlist_list = _header(b'mhlp', 92, len(playlists), {}) + items
+
+    datasets = (_record(b'mhsd', 96, track_list, type=(12, ('<I', 1)))
+                + _record(b'mhsd', 96, playlist_list, type=(12, ('<I', 2))))
+
+    return _record(b'mhbd', 104, datasets, datasets=(20, ('<I', 2)))
+
+
+def gtkpod_sha1_hash(filename):
+    """The hash of the iTunesDB, as python-gpod's gtkpod.sha1_hash"""
+    hash = hashlib.sha1()
+    hash.update(struct.pack('<L', os.path.getsize(filename)))
+    with open(filename, 'rb') as itunesdb_file:
+        hash.update(itunesdb_file.read(16384))
+    return hash.hexdigest()
+
+
+def gtkpod_ext(filename, itunesdb_file, userdata):
+    """Write the .ext file as python-gpod's gtkpod.write
+
+    userdata is given as {track id: {key: value}}.
+    """
+    with open(filename, 'w') as ext_file:
+        def write_pair(name, value):
+            ext_file.write('='.join([name, unicode(value).encode('utf-8')]))
+            ext_file.write('\n')
+
+        write_pair('itunesdb_hash', gtkpod_sha1_hash(itunesdb_file))
+        write_pair('version', '0.99.16')
+        for track_id, track_userdata in sorted(userdata.items()):
+            write_pair('id', track_id)
+            for key, value in track_userdata.items():
+                write_pair(key, value)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from ipodio.fuzzy import find_similar, normalize
+
+from expects import expect
+from mamba import describe, context, before
+
+
+class FakeTrack(object):
+    def __init__(self, title, artist, length, album=u''):
+        self.title = title
+        self.artist = artist
+        self.length = length
+        self.album = album
+
+
+with describe('find_similar') as _:
+
+    with context('given the same song with different tags'):
+        def should_group_them():
+            groups = find_similar([_.song, _.remaster, _.other_song])
+
+            expect(groups).to.have.length(1)
+            expect(groups[0][1]).to.have(_.song, _.remaster)
+
+        def should_score_the_group():
+            score, group = find_similar([_.song, _.remaster])[0]
+
+            expect(score).to.be.above(0.8)
+            expect(score).to.be.below(1.0)
+
+    with context('given the same title at very different lengths'):
+        def should_not_group_them():
+            groups = find_similar([_.song, FakeTrack(u'Imagine', u'Other', 400000)])
+
+            expect(groups).to.be.empty
+
+        def should_not_group_them_even_by_the_same_artist():
+            longer = FakeTrack(u'Imagine', u'John Lennon', 190000)
+
+            expect(find_similar([_.song, longer])).to.be.empty
+
+    with context('given other versions of the same song'):
+        def should_not_group_them():
+            live = FakeTrack(u'Imagine (Live)', u'John Lennon', 184000)
+            remix = FakeTrack(u'Imagine [Remix]', u'John Lennon', 183500)
+
+            expect(find_similar([_.song, live, remix])).to.be.empty
+
+        def should_group_the_same_version():
+            live = FakeTrack(u'Imagine (Live)', u'John Lennon', 184000)
+            other_live = FakeTrack(u'Imagine - Live', u'John Lennon', 185000)
+
+            expect(find_similar([live, other_live])).to.have.length(1)
+
+    with context('given their albums'):
+        def should_score_the_same_album_higher():
+            same = FakeTrack(u'Imagine', u'John Lennon', 184500, u'Imagine')
+            other = FakeTrack(u'Imagine', u'John Lennon', 184500, u'Live Hits')
+            song = FakeTrack(u'Imagine', u'John Lennon', 183000, u'Imagine')
+
+            same_score = find_similar([song, same])[0][0]
+            other_score = find_similar([song, other])[0][0]
+
+            expect(same_score).to.be.above(other_score)
+
+    with context('given more tracks in a block than the maximum'):
+        def should_not_compare_them():
+            tracks = [FakeTrack(u'Intro', u'', 60000) for n in range(5)]
+
+            expect(find_similar(tracks, max_block=4)).to.be.empty
+
+    @before.all
+    def fixture():
+        _.song = FakeTrack(u'Imagine', u'John Lennon', 183000)
+        _.remaster = FakeTrack(u'Imagine (Remastered 2010)', u'John Lennon', 184500)
+        _.other_song = FakeTrack(u'Jealous Guy', u'John Lennon', 254000)
+
+
+with describe('normalize') as _:
+    def should_ignore_case_accents_and_punctuation():
+        expect(normalize(u'Él, Señor!')).to.be.equal(u'el senor')
+
+    def should_ignore_leading_articles():
+        expect(normalize(u'The Beatles')).to.be.equal(u'beatles')
+
+    def should_ignore_annotations_and_featured_artists():
+        expect(normalize(u'Song (Remastered 2010) feat. Someone')).to.be.equal(u'song')
+
+    def should_keep_annotations_telling_the_version():
+        expect(normalize(u'Song [Live] (Remix)')).to.be.equal(u'song live remix')
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import mp3hash
+
+from ipodio import hashing
+from ipodio.hashing import Hasher, DEFAULT_NAME
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(Hasher) as _:
+
+    with context('when created by default'):
+        def should_have_the_default_name():
+            expect(Hasher().name).to.be.equal(DEFAULT_NAME)
+
+        def should_hash_as_mp3hash_did():
+            expected = mp3hash.mp3hash(_.song, maxbytes=512 * 1024)
+
+            expect(Hasher().hash(_.song)).to.be.equal(expected)
+
+    with context('when created with an unknown algorithm'):
+        def should_raise_ValueError():
+            expect(lambda: Hasher('unknown')).to.raise_error(ValueError)
+
+    with context('when created with a non positive maxbytes'):
+        def should_raise_ValueError_():
+            expect(lambda: Hasher('md5', 0)).to.raise_error(ValueError)
+
+    with context('the name property'):
+        def should_have_the_algorithm_and_maxbytes():
+            expect(Hasher('md5', 1024).name).to.be.equal(u'md5:1024')
+
+        def should_mark_hashers_of_whole_files():
+            expect(Hasher('md5', None).name).to.be.equal(u'md5:all')
+
+    with context('when created from a name'):
+        def should_have_that_name():
+            for name in (u'md5:1024', u'crc32:all', DEFAULT_NAME):
+                expect(Hasher.from_name(name).name).to.be.equal(name)
+
+        def should_raise_ValueError_for_invalid_names():
+            expect(lambda: Hasher.from_name(u'md5:foo')).to.raise_error(ValueError)
+
+    with context('when hashing'):
+        def should_return_a_different_digest_for_each_algorithm():
+            digests = set(Hasher(algorithm).hash(_.song)
+                          for algorithm in ('sha1', 'md5', 'crc32', 'adler32'))
+
+            expect(digests).to.have.length(4)
+
+        def should_return_checksums_as_hexadecimal_strings():
+            expect(Hasher('crc32').hash(_.song)).to.match(r'^[0-9a-f]{8}$')
+
+        def should_hash_whole_files_as_mp3hash_did():
+            expected = mp3hash.mp3hash(_.song, maxbytes=None)
+
+            expect(Hasher('sha1', None).hash(_.song)).to.be.equal(expected)
+
+        def should_hash_the_same_when_files_cannot_be_mapped():
+            mapped = Hasher('md5', 1000).hash(_.song)
+
+            hashing._map = lambda song, size: None
+            try:
+                expect(Hasher('md5', 1000).hash(_.song)).to.be.equal(mapped)
+            finally:
+                hashing._map = _.map
+
+        def should_hash_empty_files():
+            expect(Hasher('crc32').hash(_.empty)).to.be.equal('00000000')
+
+    @before.all
+    def hashing_fixture():
+        _.map = hashing._map
+        _.empty = tempfile.mkstemp()[1]
+
+    @after.all
+    def hashing_cleanup():
+        os.remove(_.empty)
+
+    @before.all
+    def fixture():
+        _.song = 'fixtures/song1.mp3'
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from spec.unit.fixtures import itunesdb, gtkpod_ext
+
+from ipodio.database import Database
+from ipodio import itunesdb as reader
+from ipodio.itunesdb import ITunesDB, ITunesDBError
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(ITunesDB) as _:
+
+    with context('when reading tracks'):
+        def should_find_every_track():
+            expect(_.database).to.have.length(2)
+
+        def should_read_the_header_fields():
+            expect(_.track['dbid']).to.be.equal(1234567890123)
+            expect(_.track['tracklen']).to.be.equal(180000)
+            expect(_.track['track_nr']).to.be.equal(3)
+
+        def should_decode_the_strings():
+            expect(_.track['title']).to.be.equal(u'Imagine')
+            expect(_.track['artist']).to.be.equal(u'John Lennon')
+
+        def should_return_None_for_missing_strings():
+            expect(_.track['genre']).to.be.none
+
+        def should_raise_KeyError_for_unknown_fields():
+            expect(lambda: _.track['foo']).to.raise_error(KeyError)
+
+        def should_locate_the_file_within_the_mountpoint():
+            expect(_.track.ipod_filename()).to.be.equal(os.path.join(
+                _.mountpoint, 'iPod_Control', 'Music', 'F00', 'ABCD.mp3'))
+
+        def should_load_the_userdata_of_the_ext_file():
+            expect(_.track['userdata']).to.be.equal({'mp3hash': u'abc'})
+
+        def should_only_keep_the_offset_of_each_track():
+            expect(hasattr(_.track, '__dict__')).to.be.false
+
+        def should_read_the_same_when_the_file_cannot_be_mapped():
+            mmap, reader.mmap = reader.mmap, None
+            try:
+                track = list(ITunesDB(_.mountpoint))[0]
+            finally:
+                reader.mmap = mmap
+
+            expect(track['title']).to.be.equal(u'Imagine')
+            expect(track['userdata']).to.be.equal({'mp3hash': u'abc'})
+
+    with context('when the ext file was written for another iTunesDB'):
+        def should_not_load_its_userdata():
+            ext_path = os.path.join(_.mountpoint, 'other.ext')
+            other_path = os.path.join(_.mountpoint, 'other')
+            with open(other_path, 'wb') as other_file:
+                other_file.write(_.data + b'\0')
+            gtkpod_ext(ext_path, other_path, {1: {'mp3hash': 'abc'}})
+
+            expect(reader._parse_userdata(
+                ext_path, lambda: reader._ext_hash(_.data))).to.be.empty
+
+    with context('when reading playlists'):
+        def should_find_every_playlist():
+            names = [playlist.get_name() for playlist in _.database.Playlists]
+
+            expect(names).to.be.equal([u'iPod', u'Favourites'])
+
+        def should_know_the_master_playlist():
+            expect(_.database.Master.get_name()).to.be.equal(u'iPod')
+
+        def should_contain_their_tracks():
+            favourites = _.database.Playlists[1]
+
+            expect([track['id'] for track in favourites]).to.be.equal([2])
+
+    with context('when used by a Database'):
+        def should_provide_its_tracks():
+            database = Database.create(_.mountpoint, internal_class=ITunesDB)
+            track = database.get_by_dbid(1234567890123)
+
+            expect(track.title).to.be.equal(u'Imagine')
+            expect(track.hash).to.be.equal(u'abc')
+
+        def should_provide_its_playlists():
+            database = Database.create(_.mountpoint, internal_class=ITunesDB)
+
+            expect(database.get_playlist(u'Favourites').tracks[0].title).to.be.equal(
+                u'One')
+
+    with context('when modifying'):
+        def should_raise_ITunesDBError():
+            expect(lambda: _.database.remove(_.track)).to.raise_error(ITunesDBError)
+            expect(lambda: _.track.__setitem__('title', u'foo')).to.raise_error(
+                ITunesDBError)
+
+    with context('when there is no iTunesDB'):
+        def should_raise_ITunesDBError_():
+            expect(lambda: ITunesDB('/not/a/mountpoint')).to.raise_error(
+                ITunesDBError)
+
+    with context('when the iTunesDB is invalid'):
+        def should_raise_ITunesDBError__():
+            with open(_.path, 'wb') as itunesdb_file:
+                itunesdb_file.write(_.data[:200])
+            try:
+                expect(lambda: ITunesDB(_.mountpoint)).to.raise_error(ITunesDBError)
+            finally:
+                with open(_.path, 'wb') as itunesdb_file:
+                    itunesdb_file.write(_.data)
+
+    @before.all
+    def fixture():
+        _.mountpoint = tempfile.mkdtemp()
+        directory = os.path.join(_.mountpoint, 'iPod_Control', 'iTunes')
+        os.makedirs(directory)
+
+        _.data = itunesdb([
+            {'id': 1, 'dbid': 1234567890123, 'tracklen': 180000, 'track_nr': 3,
+             'strings': {1: u'Imagine', 2: u':iPod_Control:Music:F00:ABCD.mp3',
+                         4: u'John Lennon'}},
+            {'id': 2, 'dbid': 2, 'strings': {1: u'One', 4: u'Johnny Cash'}},
+        ], [(u'iPod', True, [1, 2]), (u'Favourites', False, [2])])
+
+        _.path = os.path.join(directory, 'iTunesDB')
+        with open(_.path, 'wb') as itunesdb_file:
+            itunesdb_file.write(_.data)
+        gtkpod_ext(_.path + '.ext', _.path, {1: {'mp3hash': 'abc'}})
+
+        _.database = ITunesDB(_.mountpoint)
+        _.track = list(_.database)[0]
+
+    @after.all
+    def cleanup():
+        shutil.rmtree(_.mountpoint)
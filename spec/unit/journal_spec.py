@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from ipodio.journal import Journal
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(Journal) as _:
+
+    with context('when loading the recorded files'):
+        def should_tell_those_saved_by_a_checkpoint():
+            saved, unsaved = _.journal.load()
+
+            expect(saved).to.have.key(_.first)
+            expect(unsaved).to.have.key(_.second)
+
+        def should_find_them_by_their_source():
+            saved, unsaved = _.journal.load()
+
+            entry = _.journal.find(unsaved, _.second)
+
+            expect(entry['hash']).to.be.equal(u'def')
+            expect(entry['ipod_path']).to.be.equal(u':iPod_Control:Music:F00:BBBB.mp3')
+
+        def should_not_find_sources_modified_since():
+            with open(_.second, 'a') as source:
+                source.write('more')
+
+            saved, unsaved = _.journal.load()
+
+            expect(_.journal.find(unsaved, _.second)).to.be.none
+
+        def should_ignore_lines_cut_short():
+            with open(_.journal.path, 'a') as journal_file:
+                journal_file.write('{"source": "/music/th')
+
+            expect(_.journal.load()[1]).to.have.length(1)
+
+        def should_locate_the_copies():
+            saved, unsaved = _.journal.load()
+
+            expect(_.journal.ipod_filename(unsaved[_.second])).to.be.equal(
+                os.path.join(_.mountpoint, 'iPod_Control', 'Music', 'F00', 'BBBB.mp3'))
+
+    with context('when starting again without resuming'):
+        def should_forget_the_recorded_files():
+            _.journal.start()
+            _.journal.close()
+
+            expect(_.journal.load()).to.be.equal(({}, {}))
+
+    with context('when removed'):
+        def should_have_no_recorded_files():
+            _.journal.remove()
+
+            expect(_.journal.load()).to.be.equal(({}, {}))
+
+    @before.each
+    def journal_fixture():
+        _.mountpoint = tempfile.mkdtemp()
+        os.makedirs(os.path.join(_.mountpoint, 'iPod_Control', 'iTunes'))
+        _.first = os.path.join(_.mountpoint, 'first.mp3')
+        _.second = os.path.join(_.mountpoint, 'second.mp3')
+        for path in (_.first, _.second):
+            with open(path, 'w') as source:
+                source.write('ID3')
+
+        _.journal = Journal.create(_.mountpoint)
+        _.journal.start()
+        _.journal.record(_.first, u'abc', u'sha1', u':iPod_Control:Music:F00:AAAA.mp3')
+        _.journal.checkpoint()
+        _.journal.record(_.second, u'def', u'sha1', u':iPod_Control:Music:F00:BBBB.mp3')
+        _.journal.close()
+
+    @after.each
+    def journal_cleanup():
+        shutil.rmtree(_.mountpoint)
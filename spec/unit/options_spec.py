@@ -54,6 +54,11 @@ with describe(Options) as _:
         def it_should_have_a_single_active_command_property():
             expect(_.options.active_command).to.be(_.options.active_commands[0])
 
+        def it_should_use_underscores_for_dashes_within_option_names():
+            options = Options({'--dashed-option': True})
+
+            expect(options.options).to.have.key('dashed_option', True)
+
     with context('when created empty'):
         def it_should_have_empty_options():
             expect(_.empty_options.options).to.be.empty
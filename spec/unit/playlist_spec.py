@@ -1,10 +1,12 @@
 #-*- coding: utf-8 -*-
 
+from spec.unit.fixtures import Internal
+
 from ipodio.track import Track
 from ipodio.database import Playlist
 
 from expects import expect
-from mockito import mock, when, verify, any
+from mockito import mock, when, verify
 from mamba import describe, context, before
 
 
@@ -36,17 +38,40 @@ with describe(Playlist) as _:
 
     with context('when calling append'):
         def should_add_song_to_internal_playlist():
-            _.playlist.append(_.track)
+            playlist = Playlist(Internal([]))
+
+            playlist.append(_.track)
+
+            expect(playlist.internal.data).to.be.equal([_.track.internal])
+
+        def should_not_add_songs_already_in_the_playlist():
+            playlist = Playlist(Internal([_.track.internal]))
 
-            verify(_.internal_playlist).add(any())
+            playlist.append(Track(_.track.internal))
+
+            expect(playlist.internal.data).to.have.length(1)
 
     with context('when calling extend'):
         def should_add_all_songs_to_internal_playlist():
-            _.internal_playlist.invocations = []  # cleanup previous calls
+            playlist = Playlist(Internal([]))
+
+            playlist.extend([_.track, _.other_track])
+
+            expect(playlist.internal.data).to.have.length(2)
 
-            _.playlist.extend([_.track, _.track])
+        def should_add_repeated_songs_once():
+            playlist = Playlist(Internal([]))
 
-            verify(_.internal_playlist, times=2).add(any())
+            playlist.extend([_.track, _.other_track, _.track])
+
+            expect(playlist.internal.data).to.have.length(2)
+
+    with context('when checking membership'):
+        def should_contain_its_songs():
+            playlist = Playlist(Internal([_.track.internal]))
+
+            expect(_.track in playlist).to.be.true
+            expect(_.other_track in playlist).to.be.false
 
     with context('the is_master property'):
         def should_be_the_is_master_flag():
@@ -56,17 +81,26 @@ with describe(Playlist) as _:
 
     with context('when calling remove'):
         def should_detach_that_track_from_playlist():
-            _.playlist.remove(_.track)
+            playlist = Playlist(Internal([_.track.internal]))
+
+            playlist.remove(_.track)
+
+            expect(playlist.internal.data).to.be.empty
+
+        def should_ignore_tracks_not_in_the_playlist():
+            playlist = Playlist(Internal([_.track.internal]))
+
+            playlist.remove(_.other_track)
 
-            verify(_.internal_playlist).remove(any())
+            expect(playlist.internal.data).to.have.length(1)
 
     with context('when calling discard'):
         def should_detach_given_tracks_from_playlist():
-            _.internal_playlist.invocations = []  # cleanup invocations
+            playlist = Playlist(Internal([_.track.internal, _.other_track.internal]))
 
-            _.playlist.discard([_.track, _.track])
+            playlist.discard([_.track, _.other_track, _.track])
 
-            verify(_.internal_playlist, times=2).remove(any())
+            expect(playlist.internal.data).to.be.empty
 
     @before.all
     def setup():
@@ -76,7 +110,8 @@ with describe(Playlist) as _:
         _.internal_playlist = mock()
         when(_.internal_playlist).get_name().thenReturn(_.playlist_name)
 
-        _.track = mock()
+        _.track = Track(Internal({'userdata': {}, 'dbid': 1}))
+        _.other_track = Track(Internal({'userdata': {}, 'dbid': 2}))
         _.database = mock()
         _.database.internal = 'foo'
         _.created_internal_playlist = 'foo'
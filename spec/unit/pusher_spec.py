@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from spec.unit.fixtures import Internal
+
+from ipodio.track import Track
+from ipodio.copier import Copier
+from ipodio.hashing import Hasher
+from ipodio.journal import Journal
+from ipodio.database import Database
+from ipodio.pusher import Pusher, PRIORITIES, total_size
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(Pusher) as _:
+
+    with context('when reading the files'):
+        def should_give_the_new_tracks_in_their_order():
+            results = list(_.pusher.read(_.sources))
+
+            expect([result.path for result in results]).to.be.equal(_.sources)
+
+        def should_skip_files_which_are_not_music():
+            with open(_.sources[0], 'w') as source:
+                source.write('Just notes')
+
+            results = list(_.pusher.read(_.sources))
+
+            expect(results).to.have.length(2)
+            expect(_.messages[0]).to.have('which is not a music file')
+
+        def should_skip_tracks_already_in_the_ipod():
+            track = Track(Internal({'userdata': {}}))
+            track.hash = _.hasher.hash(_.sources[0])
+            _.database.add(track)
+
+            results = list(_.pusher.read(_.sources))
+
+            expect(results).to.have.length(2)
+            expect(_.messages[0]).to.have('which is already in the ipod')
+
+        def should_skip_files_given_twice():
+            results = list(_.pusher.read(_.sources + _.sources[:1]))
+
+            expect(results).to.have.length(3)
+
+        def should_give_them_in_their_order_with_several_jobs():
+            sources = []
+            for number in range(20):
+                path = os.path.join(_.music, 'many{}.mp3'.format(number))
+                with open(path, 'wb') as source:
+                    source.write(b'\xff\xfb' + os.urandom(1000 * (20 - number)))
+                sources.append(path)
+            pusher = Pusher(_.database, _.journal, jobs=4,
+                            internal_class=_.internal, report=_.messages.append)
+
+            results = list(pusher.read(sources))
+
+            expect([result.path for result in results]).to.be.equal(sources)
+
+    with context('when resuming an interrupted push'):
+        def should_not_copy_again_a_whole_copy():
+            _.interrupt(_.sources[0])
+
+            result = list(_.resuming_pusher().read(_.sources))[0]
+
+            expect(result.ipod_path).to.be.equal(_.ipod_path)
+
+        def should_copy_again_a_copy_cut_short():
+            _.interrupt(_.sources[0], size=_.hasher.maxbytes)
+
+            result = list(_.resuming_pusher().read(_.sources))[0]
+
+            expect(result.ipod_path).to.be.none
+            expect(os.path.exists(_.ipod_filename)).to.be.false
+
+        def should_skip_files_saved_in_the_database():
+            _.interrupt(_.sources[0], saved=True)
+            track = Track(Internal({'userdata': {}}))
+            track.hash = _.hasher.hash(_.sources[0])
+            _.database.add(track)
+
+            results = list(_.resuming_pusher().read(_.sources))
+
+            expect(results).to.have.length(2)
+            expect(_.messages[0]).to.have('which was sent by the interrupted')
+
+        def should_add_the_copy_without_copying_it():
+            _.interrupt(_.sources[0])
+            pusher = _.resuming_pusher()
+
+            pusher.push(pusher.read(_.sources[:1]), save=_.saved.append)
+
+            expect(_.database.tracks[0].internal['ipod_path']).to.be.equal(
+                _.ipod_path)
+            expect(_.database.copier.files).to.be.equal(0)
+
+    with context('when pushing the tracks'):
+        def should_copy_them_into_the_ipod():
+            sent = _.pusher.push(_.pusher.read(_.sources), save=_.saved.append)
+
+            expect(sent).to.be.equal(3)
+            expect(_.database.tracks).to.have.length(3)
+            expect(_.database.copier.files).to.be.equal(3)
+
+        def should_save_the_database_and_commit_the_journal():
+            _.pusher.push(_.pusher.read(_.sources), save=_.saved.append)
+
+            expect(_.saved).to.have.length(1)
+            expect(_.journal.load()[1]).to.be.empty
+
+        def should_save_the_database_every_checkpoint():
+            _.pusher.push(_.pusher.read(_.sources), checkpoint=2,
+                          save=_.saved.append)
+
+            expect(_.saved).to.have.length(2)
+
+    with context('when choosing the tracks which fit'):
+        def should_keep_them_all_when_they_fit():
+            results = _.pusher.fit(_.pusher.read(_.sources), sum(_.sizes))
+
+            expect(results).to.have.length(3)
+
+        def should_tell_the_size_of_the_files_before_reading_them():
+            expect(total_size(_.sources)).to.be.equal(sum(_.sizes))
+
+        def should_refuse_them_when_they_do_not_fit():
+            results = _.pusher.read(_.sources)
+
+            expect(lambda: _.pusher.fit(results, _.sizes[0])).to.raise_error(
+                ValueError)
+
+        def should_not_count_the_tracks_already_in_the_ipod():
+            track = Track(Internal({'userdata': {}}))
+            track.hash = _.hasher.hash(_.sources[0])
+            _.database.add(track)
+
+            results = _.pusher.fit(_.pusher.read(_.sources), sum(_.sizes[1:]))
+
+            expect(results).to.have.length(2)
+
+        def should_choose_them_in_their_order():
+            results = _.pusher.fit(_.pusher.read(_.sources), _.sizes[0],
+                                   choose=True)
+
+            expect([result.path for result in results]).to.be.equal(
+                [_.sources[0]])
+
+        def should_choose_them_by_priority():
+            results = _.pusher.fit(_.pusher.read(_.sources), _.sizes[0],
+                                   True, PRIORITIES['smallest'])
+
+            expect([result.path for result in results]).to.be.equal(
+                _.sources[1:])
+
+    with context('when planning'):
+        def should_tell_the_tracks_which_would_be_sent():
+            _.pusher.plan(_.pusher.read(_.sources))
+
+            expect(_.messages).to.have('Would send 3 tracks, 0.0 MB')
+            expect(_.database.tracks).to.be.empty
+
+        def should_tell_how_long_it_would_take():
+            _.pusher.plan(_.pusher.read(_.sources))
+
+            expect(_.messages[-2]).to.have('it would take about 0:00:01')
+
+        def should_warn_when_they_do_not_fit():
+            _.pusher.plan(_.pusher.read(_.sources), free=_.sizes[0])
+
+            expect(_.messages[0]).to.match('^Warning')
+            expect(_.messages).to.have('Would send 3 tracks, 0.0 MB')
+
+        def should_only_tell_those_which_fit_with_fit():
+            _.pusher.plan(_.pusher.read(_.sources), free=_.sizes[0], fit=True)
+
+            expect(_.messages).to.have('Would send 1 tracks, 0.0 MB')
+
+    @before.each
+    def pusher_fixture():
+        _.mountpoint = tempfile.mkdtemp()
+        _.music = tempfile.mkdtemp()
+        music_directory = os.path.join(_.mountpoint, 'iPod_Control', 'Music')
+        os.makedirs(os.path.join(_.mountpoint, 'iPod_Control', 'iTunes'))
+        os.makedirs(os.path.join(music_directory, 'F00'))
+
+        _.sizes = [5000, 3000, 2000]
+        _.sources = []
+        for number, size in enumerate(_.sizes):
+            path = os.path.join(_.music, 'song{}.mp3'.format(number))
+            with open(path, 'wb') as source:
+                source.write(b'\xff\xfb' + os.urandom(size - 2))
+            _.sources.append(path)
+
+        _.ipod_path = u':iPod_Control:Music:F00:AAAA.mp3'
+        _.ipod_filename = os.path.join(music_directory, 'F00', 'AAAA.mp3')
+
+        _.hasher = Hasher('sha1', 1024)
+        _.database = Database(Internal([]), hasher=_.hasher,
+                              copier=Copier(_.mountpoint))
+        _.journal = Journal.create(_.mountpoint)
+        _.journal.start()
+        _.messages = []
+        _.saved = []
+        _.internal = lambda filename: Internal(
+            {'userdata': {}, 'filename_locale': filename})
+
+        _.pusher = Pusher(_.database, _.journal, internal_class=_.internal,
+                          report=_.messages.append,
+                          write_rate=lambda mountpoint: 9000.0)
+
+        def interrupt(source, size=None, saved=False):
+            """Leave the source copied into the iPod by an interrupted push"""
+            with open(source, 'rb') as source_file:
+                data = source_file.read()
+            with open(_.ipod_filename, 'wb') as copy:
+                copy.write(data[:size])
+
+            _.journal.record(source, _.hasher.hash(source), _.hasher.name,
+                             _.ipod_path)
+            if saved:
+                _.journal.checkpoint()
+            _.journal.close()
+
+        def resuming_pusher():
+            saved, unsaved = _.journal.load()
+            _.journal.start(resume=True)
+            return Pusher(_.database, _.journal, saved, unsaved,
+                          internal_class=_.internal, report=_.messages.append)
+        _.interrupt = interrupt
+        _.resuming_pusher = resuming_pusher
+
+    @after.each
+    def remove_directories():
+        _.journal.close()
+        shutil.rmtree(_.mountpoint)
+        shutil.rmtree(_.music)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from ipodio.workers import RateLimiter
+
+from expects import expect
+from mamba import describe, context, before
+
+
+with describe(RateLimiter) as _:
+
+    with context('when created with a non positive rate'):
+        def should_raise_ValueError():
+            expect(lambda: RateLimiter(0)).to.raise_error(ValueError)
+
+    with context('when acquiring'):
+        def should_not_wait_for_the_first_amount():
+            limiter = _.limiter()
+
+            limiter.acquire(100)
+
+            expect(_.sleeps).to.be.empty
+
+        def should_wait_for_the_time_the_previous_amounts_take():
+            limiter = _.limiter()
+
+            limiter.acquire(100)
+            limiter.acquire(50)
+            limiter.acquire(10)
+
+            expect(_.sleeps).to.be.equal([1.0, 1.5])
+
+        def should_not_wait_once_the_time_has_passed():
+            limiter = _.limiter()
+
+            limiter.acquire(100)
+            _.now[0] = 10.0
+            limiter.acquire(100)
+
+            expect(_.sleeps).to.be.empty
+
+    @before.each
+    def fixture():
+        _.now = [0.0]
+        _.sleeps = []
+        _.limiter = lambda: RateLimiter(100, clock=lambda: _.now[0],
+                                        sleep=_.sleeps.append)
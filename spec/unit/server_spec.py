@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import socket
+import tempfile
+import threading
+from StringIO import StringIO
+
+from spec.unit.fixtures import itunesdb
+
+from ipodio import handlers
+from ipodio import server
+from ipodio.server import Server, forward
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+def write_itunesdb(mountpoint, title):
+    directory = os.path.join(mountpoint, 'iPod_Control', 'iTunes')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    path = os.path.join(directory, 'iTunesDB')
+    with open(path + '.tmp', 'wb') as itunesdb_file:
+        itunesdb_file.write(itunesdb([{'id': 1, 'dbid': 1, 'strings': {1: title}}],
+                                     [(u'iPod', True, [1])]))
+    os.rename(path + '.tmp', path)  # A new inode, as when it is rewritten
+
+
+with describe(Server) as _:
+
+    with context('when running commands'):
+        def should_write_their_output():
+            status = _.server.run(['list'], _.output)
+
+            expect(status).to.be.equal(0)
+            expect(_.output.getvalue()).to.be.equal('Imagine\n')
+
+        def should_keep_the_database_loaded():
+            _.server.run(['list'], _.output)
+            _.server.run(['list'], _.output)
+
+            expect(_.loaded).to.have.length(1)
+
+        def should_load_it_again_when_the_itunesdb_changes():
+            _.server.run(['list'], _.output)
+            write_itunesdb(_.mountpoint, u'One')
+
+            _.server.run(['list'], _.output)
+
+            expect(_.loaded).to.have.length(2)
+            expect(_.output.getvalue()).to.be.equal('Imagine\nOne\n')
+
+        def should_return_the_status_of_failed_commands():
+            status = _.server.run(['fail'], _.output)
+
+            expect(status).to.be.equal(1)
+            expect(_.output.getvalue()).to.be.equal('Error: failed\n')
+
+    with context('when the iPod is not available'):
+        def should_fail_the_commands():
+            os.remove(os.path.join(_.mountpoint, 'iPod_Control', 'iTunes',
+                                   'iTunesDB'))
+
+            status = _.server.run(['list'], _.output)
+
+            expect(status).to.be.equal(1)
+            expect(_.output.getvalue()).to.be.equal(
+                'Error: The iPod at "{}" is not available\n'.format(_.mountpoint))
+            expect(_.loaded).to.be.empty
+
+    with context('when listening'):
+        def should_refuse_directories_others_can_use():
+            os.chmod(_.mountpoint, 0o755)
+
+            expect(_.server._listen).to.raise_error(SystemExit)
+
+    with context('when forwarding commands'):
+        def should_get_their_output_and_status():
+            _.start()
+
+            status = forward(_.mountpoint, ['list'], path=_.server.path,
+                             stdout=_.output)
+
+            expect(status).to.be.equal(0)
+            expect(_.output.getvalue()).to.be.equal('Imagine\n')
+
+        def should_not_wait_for_idle_clients():
+            timeout, server.CLIENT_TIMEOUT = server.CLIENT_TIMEOUT, 0.1
+            idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                _.start()
+                idle.connect(_.server.path)
+
+                status = forward(_.mountpoint, ['list'], path=_.server.path,
+                                 stdout=_.output)
+            finally:
+                server.CLIENT_TIMEOUT = timeout
+                idle.close()
+
+            expect(status).to.be.equal(0)
+
+        def should_not_forward_into_directories_others_can_use():
+            _.start()
+            os.chmod(_.mountpoint, 0o755)
+
+            expect(forward(_.mountpoint, ['list'], path=_.server.path)).to.be.none
+
+        def should_return_None_when_there_is_no_server():
+            path = os.path.join(_.mountpoint, 'missing.sock')
+
+            expect(forward(_.mountpoint, ['list'], path=path)).to.be.none
+
+    @before.each
+    def server_fixture():
+        _.mountpoint = tempfile.mkdtemp()
+        write_itunesdb(_.mountpoint, u'Imagine')
+        _.loaded = []
+        _.output = StringIO()
+
+        def dispatch(argv):
+            if argv == ['fail']:
+                handlers.error('failed')
+            database = handlers._open_database(_.mountpoint)
+            if database not in _.loaded:
+                _.loaded.append(database)
+            for track in database.tracks:
+                print(track.title)
+
+        _.server = Server(_.mountpoint, dispatch,
+                          path=os.path.join(_.mountpoint, 'ipodio.sock'))
+
+        def start():
+            thread = threading.Thread(target=_.server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            while forward(_.mountpoint, None, path=_.server.path) is None:
+                time.sleep(0.01)
+        _.start = start
+
+    @after.each
+    def server_cleanup():
+        handlers.end_session(save=False)
+        shutil.rmtree(_.mountpoint)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from spec.unit.fixtures import patch_gpod_module
+
+patch_gpod_module()
+
+from ipodio import handlers
+from ipodio.handlers import Session
+
+from expects import expect
+from mockito import mock, verify
+from mamba import describe, context, before, after
+
+
+with describe(Session) as _:
+
+    with context('when commands open the database'):
+        def should_share_a_single_database():
+            expect(handlers._open_database('/mount')).to.be(_.database)
+            expect(handlers._open_database('/mount')).to.be(_.database)
+
+            expect(_.created).to.have.length(1)
+
+        def should_index_it_once():
+            handlers._open_indexed_database('/mount', None, None, None)
+            handlers._open_indexed_database('/mount', None, None, None)
+
+            verify(_.database, times=1).update_index(jobs=1)
+
+    with context('when commands save the database'):
+        def should_not_save_it():
+            handlers._save(handlers._open_database('/mount'))
+
+            verify(_.database, times=0).save()
+
+        def should_save_it_when_the_session_ends():
+            handlers._save(handlers._open_database('/mount'))
+
+            handlers.end_session()
+
+            verify(_.database, times=1).save()
+
+        def should_not_save_it_when_the_session_is_dropped():
+            handlers._save(handlers._open_database('/mount'))
+
+            handlers.end_session(save=False)
+
+            verify(_.database, times=0).save()
+
+    with context('when nothing was changed'):
+        def should_not_save_it_when_the_session_ends():
+            handlers._open_database('/mount')
+
+            handlers.end_session()
+
+            verify(_.database, times=0).save()
+
+    @before.each
+    def session_fixture():
+        _.created = []
+        _.database = mock()
+        _.database.updated = False
+
+        def create_database(mount, hasher=None, read_only=False):
+            _.created.append(mount)
+            return _.database
+
+        _.create_database = handlers._create_database
+        handlers._create_database = create_database
+        handlers.start_session('/mount')
+
+    @after.each
+    def session_cleanup():
+        handlers.end_session(save=False)
+        handlers._create_database = _.create_database
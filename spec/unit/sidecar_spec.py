@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from ipodio.sidecar import Sidecar, ITUNES_DIRECTORY
+
+from expects import expect
+from mamba import describe, context, before, after
+
+
+with describe(Sidecar) as _:
+
+    with context('when fabricated'):
+        def should_be_next_to_the_itunesdb():
+            expect(os.path.dirname(_.sidecar.path)).to.be.equal(
+                os.path.dirname(_.sidecar.itunesdb_path))
+
+    with context('when not saved'):
+        def should_load_nothing():
+            expect(_.sidecar.load()).to.be.none
+
+    with context('when saved'):
+        def should_load_the_saved_entries():
+            _.sidecar.save(_.entries)
+
+            expect(_.sidecar.load()).to.be.equal(_.entries)
+
+        def should_load_nothing_if_the_itunesdb_changed():
+            _.sidecar.save(_.entries)
+
+            with open(_.sidecar.itunesdb_path, 'a') as itunesdb:
+                itunesdb.write('more tracks')
+
+            expect(_.sidecar.load()).to.be.none
+
+    with context('when there is no itunesdb'):
+        def should_not_be_saved():
+            os.remove(_.sidecar.itunesdb_path)
+
+            _.sidecar.save(_.entries)
+
+            expect(os.path.exists(_.sidecar.path)).to.be.false
+
+    @before.each
+    def fixture():
+        _.mountpoint = tempfile.mkdtemp()
+        os.makedirs(os.path.join(_.mountpoint, ITUNES_DIRECTORY))
+        _.sidecar = Sidecar.create(_.mountpoint)
+        with open(_.sidecar.itunesdb_path, 'w') as itunesdb:
+            itunesdb.write('tracks')
+        _.entries = {
+            1234: (u'204939024023840234', u'sha1:524288'),
+            5678: (u'84c09dcb', u'crc32:all'),
+        }
+
+    @after.each
+    def cleanup():
+        shutil.rmtree(_.mountpoint)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from spec.unit.fixtures import patch_gpod_module, Internal
+
+patch_gpod_module()
+
+from ipodio.track import Track
+from ipodio.sorting import collate, parse_order, sorted_tracks, DEFAULT_ORDER
+
+from expects import expect
+from mamba import describe, context
+
+
+def track(artist=u'', album=u'', title=u'', number=None, year=None):
+    return Track(Internal({'artist': artist, 'album': album, 'title': title,
+                           'track_nr': number, 'year': year}))
+
+
+with describe('sorting') as _:
+
+    with context('when collating text'):
+        def should_ignore_case_and_accents():
+            expect(collate(u'Álvaro')).to.be.equal(collate(u'alvaro'))
+
+        def should_ignore_leading_articles():
+            expect(collate(u'The Beatles')).to.be.equal(u'beatles')
+
+    with context('when parsing the order'):
+        def should_return_the_fields():
+            expect(parse_order('artist, Year,album')).to.be.equal(
+                ('artist', 'year', 'album'))
+
+        def should_return_the_default_order_when_missing():
+            expect(parse_order(None)).to.be.equal(DEFAULT_ORDER)
+
+        def should_raise_ValueError_for_unknown_fields():
+            expect(lambda: parse_order('artist,colour')).to.raise_error(ValueError)
+
+    with context('when sorting tracks'):
+        def should_sort_by_artist_album_and_number_by_default():
+            tracks = [track(u'Beatles', u'Help', number=2),
+                      track(u'ABBA', u'Arrival'),
+                      track(u'The Beatles', u'Help', number=1),
+                      track(u'Beatles', u'Abbey Road', number=10)]
+
+            result = sorted_tracks(list(tracks))
+
+            expect(result).to.be.equal(
+                [tracks[1], tracks[3], tracks[2], tracks[0]])
+
+        def should_sort_numbers_as_numbers():
+            tracks = [track(number=10), track(number=9)]
+
+            expect(sorted_tracks(list(tracks))).to.be.equal(tracks[::-1])
+
+        def should_sort_by_the_given_fields():
+            tracks = [track(u'Beatles', u'Abbey Road', year=1969),
+                      track(u'Beatles', u'Help', year=1965)]
+
+            result = sorted_tracks(list(tracks), ('artist', 'year', 'album'))
+
+            expect(result).to.be.equal(tracks[::-1])
+
+        def should_sort_elements_by_their_track():
+            groups = [(None, [track(u'B')]), (None, [track(u'A')])]
+
+            result = sorted_tracks(list(groups), key=lambda group: group[1][0])
+
+            expect(result).to.be.equal(groups[::-1])
+
+        def should_take_the_key_again_when_the_track_changes():
+            first, second = track(u'A'), track(u'B')
+            sorted_tracks([first, second])
+
+            first.internal['artist'] = u'C'
+            first.refresh()
+
+            expect(sorted_tracks([first, second])).to.be.equal([second, first])
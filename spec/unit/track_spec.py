@@ -5,6 +5,7 @@ from spec.unit.fixtures import Internal, patch_gpod_module
 patch_gpod_module()
 
 from ipodio.track import Track
+from ipodio.hashing import DEFAULT_NAME
 
 from expects import expect
 from mockito import mock, spy, when, verify, any
@@ -32,6 +33,20 @@ with describe(Track) as _:
 
             verify(_.track._hasher).hash('filename.mp3')
 
+        def should_store_the_name_of_the_hasher():
+            _.track.update_hash()
+
+            expect(_.track.hash_name).to.be.equal(_.hasher.name)
+
+    with context('the hash_name property'):
+        def should_be_none_if_there_is_no_hash():
+            expect(_.track.hash_name).to.be.none
+
+        def should_be_the_default_name_for_hashes_stored_without_name():
+            _.track.hash = _.hash
+
+            expect(_.track.hash_name).to.be.equal(DEFAULT_NAME)
+
     with context('when compute_hash'):
         def should_use_the_hasher():
             _.track.compute_hash()
@@ -82,6 +97,53 @@ with describe(Track) as _:
 
             expect(track.artist).to.be.equal(u'')
 
+    with context('the record property'):
+        def should_have_the_track_fields():
+            record = create_track(genre='Rock', tracklen=1000).record
+
+            expect(record).to.have.properties(
+                number=2, title=u'The Title', album=u'', artist=u'The Artist',
+                genre=u'Rock', length=1000)
+
+        def should_be_read_only():
+            def change_title():
+                _.track.record.title = u'Other'
+
+            expect(change_title).to.raise_error(AttributeError)
+
+        def should_keep_the_fields_until_refreshed():
+            track = create_track()
+            track.title
+
+            track.internal['title'] = 'Other'
+            expect(track.title).to.be.equal(u'The Title')
+
+            track.refresh()
+            expect(track.title).to.be.equal(u'Other')
+
+    with context('the dbid property'):
+        def should_not_read_the_other_fields():
+            read = []
+
+            class Recording(Internal):
+                def __getitem__(self, name):
+                    read.append(name)
+                    return Internal.__getitem__(self, name)
+
+            Track(Recording({'dbid': 1234})).dbid
+
+            expect(read).to.be.equal(['dbid'])
+
+        def should_be_the_dbid():
+            expect(create_track(dbid=1234).dbid).to.be.equal(1234)
+
+    with context('the genre property'):
+        def should_be_the_genre():
+            expect(create_track(genre='Rock').genre).to.be.equal(u'Rock')
+
+        def should_be_empty_if_not_set():
+            expect(_.track.genre).to.be.equal(u'')
+
     with context('the extension property'):
         def should_be_unicode___():
             expect(_.track.extension).to.be.an(unicode)
@@ -136,6 +198,7 @@ with describe(Track) as _:
         _.hash = '204939024023840234'
 
         _.hasher = mock()
+        _.hasher.name = u'md5:1024'
         when(_.hasher).hash(any(unicode)).thenReturn(_.hash)
 
         _.track_data = {
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+from ipodio.workers import imap, Consumer, Stopwatch
+
+from expects import expect
+from mamba import describe, context, before
+
+
+with describe('imap') as _:
+
+    with context('with a single job'):
+        def should_return_the_results_in_order():
+            expect(list(imap(_.double, _.numbers))).to.be.equal(_.doubled)
+
+        def should_run_in_the_calling_thread():
+            threads = set(imap(_.current_thread, _.numbers))
+
+            expect(threads).to.be.equal(set([threading.current_thread()]))
+
+    with context('with several jobs'):
+        def should_return_the_results_in_order_():
+            expect(list(imap(_.double, _.numbers, jobs=4))).to.be.equal(_.doubled)
+
+        def should_run_in_worker_threads():
+            threads = set(imap(_.current_thread, _.numbers, jobs=4))
+
+            expect(threads).not_to.have(threading.current_thread())
+
+        def should_raise_errors_in_the_calling_thread():
+            def fail(number):
+                raise ValueError(number)
+
+            call = lambda: list(imap(fail, _.numbers, jobs=4))
+
+            expect(call).to.raise_error(ValueError)
+
+        def should_not_read_far_ahead_of_the_results():
+            taken = []
+
+            def numbers():
+                for number in _.numbers:
+                    taken.append(number)
+                    yield number
+
+            results = imap(_.double, numbers(), jobs=4, buffer=8)
+            next(results)
+
+            expect(len(taken)).to.be.below(10)
+
+        def should_wait_for_the_running_calls_when_closed():
+            finished = []
+
+            def slow(number):
+                time.sleep(0.3)
+                finished.append(number)
+
+            results = imap(slow, _.numbers, jobs=4, buffer=8)
+            next(results)
+            results.close()
+            count = len(finished)
+            time.sleep(0.4)
+
+            expect(len(finished)).to.be.equal(count)
+
+    @before.all
+    def fixture():
+        _.numbers = range(100)
+        _.doubled = [2 * number for number in _.numbers]
+        _.double = lambda number: 2 * number
+        _.current_thread = lambda number: threading.current_thread()
+
+
+with describe(Consumer) as _:
+
+    def should_call_the_function_in_order():
+        consumed = []
+        consumer = Consumer(consumed.append, size=2)
+
+        for number in range(10):
+            consumer.put(number)
+        consumer.close()
+
+        expect(consumed).to.be.equal(range(10))
+
+    def should_run_in_its_own_thread():
+        threads = []
+        consumer = Consumer(lambda item: threads.append(threading.current_thread()))
+
+        consumer.put(1)
+        consumer.close()
+
+        expect(threads).not_to.have(threading.current_thread())
+
+    def should_wait_for_the_items_put_so_far():
+        consumed = []
+        consumer = Consumer(consumed.append)
+
+        for number in range(10):
+            consumer.put(number)
+        consumer.wait()
+
+        expect(consumed).to.have.length(10)
+        consumer.close()
+
+    def should_return_the_failures_when_closed():
+        failure = ValueError()
+
+        def fail(number):
+            if number == 1:
+                raise failure
+
+        consumer = Consumer(fail)
+        for number in range(3):
+            consumer.put(number)
+
+        expect(consumer.close()).to.be.equal([(1, failure)])
+
+
+with describe(Stopwatch) as _:
+
+    def should_add_up_the_seconds_of_each_stage():
+        ticks = iter([0, 1, 3, 10, 14])
+        stopwatch = Stopwatch(clock=lambda: next(ticks))
+
+        with stopwatch.measure('parsing'):
+            pass
+        with stopwatch.measure('parsing'):
+            pass
+
+        expect(stopwatch.seconds['parsing']).to.be.equal(6)
+
+    def should_measure_stages_which_fail():
+        stopwatch = Stopwatch()
+
+        def fail():
+            with stopwatch.measure('hashing'):
+                raise ValueError()
+
+        expect(fail).to.raise_error(ValueError)
+        expect(stopwatch.seconds).to.have.key('hashing')